@@ -1,20 +1,28 @@
+from collections import OrderedDict
+from typing import FrozenSet, Optional, Tuple
+
 import chess
 import chess.svg
 import streamlit as st
 from autogen import ConversableAgent, register_function
 
+from analysis import GameAnalysis, MoveAnalyzer
+from oracle import MoveOracle, register_oracle
+
 if "qwen_api_key" not in st.session_state:
     st.session_state.qwen_api_key = None
 if "board" not in st.session_state:
     st.session_state.board = chess.Board()
 if "made_move" not in st.session_state:
     st.session_state.made_move = False
-if "board_svg" not in st.session_state:
-    st.session_state.board_svg = None
 if "move_history" not in st.session_state:
     st.session_state.move_history = []
 if "max_turns" not in st.session_state:
     st.session_state.max_turns = 5
+if "legal_move_cache" not in st.session_state:
+    st.session_state.legal_move_cache = OrderedDict()
+if "compact_moves" not in st.session_state:
+    st.session_state.compact_moves = True
 
 st.sidebar.title("象棋代理配置")
 qwen_api_key = st.sidebar.text_input("输入您的Qwen API密钥:", type="password")
@@ -40,29 +48,168 @@ if max_turns_input:
     st.session_state.max_turns = max_turns_input
     st.sidebar.success(f"总移动次数设置为 {st.session_state.max_turns}!")
 
+st.session_state.compact_moves = st.sidebar.checkbox(
+    "按棋子分组发送合法移动 (更少的 token)",
+    value=st.session_state.compact_moves,
+)
+
+st.sidebar.subheader("本地走法库")
+book_path = st.sidebar.text_input("Polyglot 开局库文件 (.bin)", value="")
+book_plies = st.sidebar.number_input("开局库使用的最大步数 (ply)", min_value=0, max_value=60, value=16)
+tablebase_dir = st.sidebar.text_input("Syzygy 残局库目录", value="")
+oracle_white = st.sidebar.checkbox("白棋使用本地走法库", value=True)
+oracle_black = st.sidebar.checkbox("黑棋使用本地走法库", value=True)
+
+
+@st.cache_resource(show_spinner=False)
+def load_oracle(book_path: str, tablebase_dir: str, max_book_plies: int) -> MoveOracle:
+    """开局库和残局库以内存映射方式打开, 按路径在会话间共享"""
+    return MoveOracle(book_path, tablebase_dir, max_book_plies)
+
+
+st.sidebar.subheader("走法质量分析")
+engine_path = st.sidebar.text_input("本地 UCI 引擎路径 (如 stockfish, 留空则不分析)", value="")
+engine_depth = st.sidebar.number_input("分析深度", min_value=4, max_value=30, value=12)
+
+
+@st.cache_resource(show_spinner=False)
+def load_analyzer(engine_path: str, depth: int) -> MoveAnalyzer:
+    """引擎进程池和局面评估缓存在会话间共享"""
+    return MoveAnalyzer(engine_path, depth=depth)
+
+
+if "game_analysis" not in st.session_state:
+    st.session_state.game_analysis = None
+analyzer = load_analyzer(engine_path.strip(), int(engine_depth)) if engine_path.strip() else None
+
+oracle = load_oracle(book_path.strip(), tablebase_dir.strip(), int(book_plies))
+if oracle.book is not None or oracle.tablebase is not None:
+    st.sidebar.caption(
+        f"本地走法库命中: 开局库 {oracle.stats['book']} 次, 残局库 {oracle.stats['tablebase']} 次"
+    )
+
 st.title("使用AutoGen代理的象棋游戏")
 
+HISTORY_PAGE_SIZE = 10
+
+
+# st.cache_data survives reruns (a module-level lru_cache would be rebuilt every rerun);
+# max_entries bounds it and evicts the least recently used boards
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_board_svg(fen: str, last_move: Optional[str] = None, size: int = 400) -> str:
+    """按 FEN 和最后一步(UCI)渲染棋盘 SVG, 结果按参数缓存"""
+    board = chess.Board(fen)
+    if last_move is None:
+        return chess.svg.board(board, size=size)
+    move = chess.Move.from_uci(last_move)
+    return chess.svg.board(board,
+                           arrows=[(move.from_square, move.to_square)],
+                           fill={move.from_square: "gray"},
+                           size=size)
+
+
+def display_move_history():
+    """分页显示移动历史, 只渲染当前页的棋盘"""
+    history = st.session_state.move_history
+    if not history:
+        return
+
+    st.subheader("移动历史")
+    pages = (len(history) - 1) // HISTORY_PAGE_SIZE + 1
+    page = st.number_input("页码", min_value=1, max_value=pages, value=pages, step=1)
+    start = (page - 1) * HISTORY_PAGE_SIZE
+    end = min(start + HISTORY_PAGE_SIZE, len(history))
+    st.caption(f"共 {len(history)} 步, 第 {page}/{pages} 页")
+
+    # Replaying UCI moves is cheap; only the boards on this page are rendered
+    board = chess.Board()
+    for uci in history[:start]:
+        board.push_uci(uci)
+    for i in range(start, end):
+        board.push_uci(history[i])
+        # Determine which agent made the move: even-indexed moves are by White
+        move_by = "白棋代理" if i % 2 == 0 else "黑棋代理"
+        st.write(f"移动 {i + 1} 由 {move_by}: `{history[i]}`")
+        st.image(render_board_svg(board.fen(), history[i]))
+
+
+LEGAL_MOVE_CACHE_SIZE = 1024
+
+
+def get_legal_moves(board: chess.Board) -> Tuple[Tuple[str, ...], FrozenSet[str]]:
+    """返回局面的合法移动 (有序 UCI 元组, UCI 集合), 按 Zobrist 置换键缓存"""
+    key = board._transposition_key()
+    cache = st.session_state.legal_move_cache
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+
+    moves = tuple(move.uci() for move in board.legal_moves)
+    cache[key] = (moves, frozenset(moves))
+    if len(cache) > LEGAL_MOVE_CACHE_SIZE:
+        cache.popitem(last=False)
+    return cache[key]
+
+
+def format_moves_compact(board: chess.Board, moves: Tuple[str, ...]) -> str:
+    """按起始格分组, 例如 "Ng1:f3,h3; e2:e3,e4"; 起始格+目标格即 UCI 移动"""
+    groups = {}
+    for uci in moves:
+        groups.setdefault(uci[:2], []).append(uci[2:])
+    parts = []
+    for from_square, targets in groups.items():
+        piece = board.piece_at(chess.parse_square(from_square))
+        prefix = "" if piece.piece_type == chess.PAWN else piece.symbol().upper()
+        parts.append(f"{prefix}{from_square}:{','.join(targets)}")
+    return "; ".join(parts)
+
+
+def display_move_analysis():
+    """显示已完成的走法质量分析 (厘兵损失和准确率)"""
+    game_analysis = st.session_state.game_analysis
+    if game_analysis is None or not game_analysis.moves:
+        return
+
+    st.subheader("走法质量")
+    summary = game_analysis.summary()
+    col_white, col_black = st.columns(2)
+    for col, side, name in ((col_white, "white", "白棋"), (col_black, "black", "黑棋")):
+        with col:
+            st.metric(f"{name}准确率", summary[side]["accuracy"] if summary[side]["analyzed"] else "-")
+            st.caption(f"平均厘兵损失: {summary[side]['acpl']}, 已分析 {summary[side]['analyzed']} 步")
+    rows = game_analysis.rows()
+    st.caption(f"已分析 {len(rows)}/{len(game_analysis.moves)} 步, 引擎统计: {game_analysis.analyzer.stats}")
+    if rows:
+        st.dataframe(rows)
+    if len(rows) < len(game_analysis.moves):
+        st.button("刷新分析")
+
+
 def available_moves() -> str:
-    available_moves = [str(move) for move in st.session_state.board.legal_moves]
-    return "可用的移动是: " + ",".join(available_moves)
+    board = st.session_state.board
+    moves, _ = get_legal_moves(board)
+    if st.session_state.compact_moves:
+        return ("可用的移动(按起始格分组, 起始格+目标格即 UCI, 如 g1:f3 即 g1f3): "
+                + format_moves_compact(board, moves))
+    return "可用的移动是: " + ",".join(moves)
 
 def execute_move(move: str) -> str:
     try:
         chess_move = chess.Move.from_uci(move)
-        if chess_move not in st.session_state.board.legal_moves:
+        _, legal_moves = get_legal_moves(st.session_state.board)
+        if chess_move.uci() not in legal_moves:
             return f"无效的移动: {move}. 请调用 available_moves() 查看有效的移动。"
         
+        # Queue background analysis of the move; this never waits for the engine
+        if st.session_state.game_analysis is not None:
+            st.session_state.game_analysis.add_move(st.session_state.board, chess_move)
+
         # Update board state
         st.session_state.board.push(chess_move)
         st.session_state.made_move = True
 
-        # Generate and store board visualization
-        board_svg = chess.svg.board(st.session_state.board,
-                                  arrows=[(chess_move.from_square, chess_move.to_square)],
-                                  fill={chess_move.from_square: "gray"},
-                                  size=400)
-        st.session_state.board_svg = board_svg
-        st.session_state.move_history.append(board_svg)
+        # Store the move only; boards are rendered on demand from the move list
+        st.session_state.move_history.append(chess_move.uci())
 
         # Get piece information
         moved_piece = st.session_state.board.piece_at(chess_move.to_square)
@@ -95,6 +242,12 @@ def check_made_move(msg):
     else:
         return False
 
+def execute_oracle_move(move: str) -> str:
+    # The oracle bypasses the nested chat, so nothing will consume made_move
+    move_desc = execute_move(move)
+    st.session_state.made_move = False
+    return move_desc
+
 if st.session_state.qwen_api_key:
     try:
         agent_white_config_list = [
@@ -193,6 +346,13 @@ if st.session_state.qwen_api_key:
             ],
         )
 
+        if oracle_white:
+            register_oracle(agent_white, agent_black, oracle,
+                            lambda: st.session_state.board, execute_oracle_move)
+        if oracle_black:
+            register_oracle(agent_black, agent_white, oracle,
+                            lambda: st.session_state.board, execute_oracle_move)
+
         st.info("""
 这个象棋游戏是由两个AG2 AI代理进行的:
 - **Agent White**: 一个由Qwen-plus-latest驱动的象棋玩家，控制白棋
@@ -205,15 +365,14 @@ if st.session_state.qwen_api_key:
 - 提供合法的移动信息
 """)
 
-        initial_board_svg = chess.svg.board(st.session_state.board, size=300)
         st.subheader("初始棋盘")
-        st.image(initial_board_svg)
+        st.image(render_board_svg(chess.STARTING_FEN, size=300))
 
         if st.button("Start Game"):
             st.session_state.board.reset()
             st.session_state.made_move = False
             st.session_state.move_history = []
-            st.session_state.board_svg = chess.svg.board(st.session_state.board, size=300)
+            st.session_state.game_analysis = GameAnalysis(analyzer) if analyzer else None
             st.info("AI代理现在将相互对战。每个代理将分析棋盘，" 
                    "从Game Master(代理)请求合法的移动，并做出战略决策。")
             st.success("您可以在终端输出中查看代理之间的交互，在代理之间的轮次结束后，您可以查看所有棋盘移动显示在下面!")
@@ -227,25 +386,16 @@ if st.session_state.qwen_api_key:
             )
             st.markdown(chat_result.summary)
 
-            # Display the move history (boards for each move)
-            st.subheader("移动历史")
-            for i, move_svg in enumerate(st.session_state.move_history):
-                # Determine which agent made the move
-                if i % 2 == 0:
-                    move_by = "白棋代理"  # Even-indexed moves are by White
-                else:
-                    move_by = "黑棋代理"  # Odd-indexed moves are by Black
-                
-                st.write(f"移动 {i + 1} 由 {move_by}")
-                st.image(move_svg)
-
         if st.button("Reset Game"):
             st.session_state.board.reset()
             st.session_state.made_move = False
             st.session_state.move_history = []
-            st.session_state.board_svg = None
+            st.session_state.game_analysis = GameAnalysis(analyzer) if analyzer else None
             st.write("游戏重置! 点击 '开始游戏' 开始新游戏。")
 
+        display_move_history()
+        display_move_analysis()
+
     except Exception as e:
         st.error(f"发生错误: {e}. 请检查您的API密钥并重试。")
 
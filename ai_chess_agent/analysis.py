@@ -0,0 +1,198 @@
+"""
+走法质量分析
+---------------------------------
+用本地 UCI 引擎 (如 Stockfish) 在后台进程池中评估每一步, 计算每步的厘兵损失 (centipawn loss)
+和每一方的准确率。
+
+- MoveAnalyzer: 进程池 + 按局面 (EPD, 不含步数计数) 缓存的评估结果, 可在多局之间共享。
+  同时在途的评估数有上限, 达到上限时新的走法直接跳过分析, 从不阻塞对局。
+- GameAnalysis: 一局棋的走法记录, 只读取已经完成的评估, 不等待。
+"""
+
+import atexit
+import logging
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional
+
+import chess
+import chess.engine
+
+MATE_SCORE = 10000
+
+logger = logging.getLogger(__name__)
+
+_engine: Optional[chess.engine.SimpleEngine] = None
+
+
+def _init_worker(engine_path: str):
+    """每个工作进程启动一个引擎实例"""
+    global _engine
+    _engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+    atexit.register(_engine.quit)
+
+
+def _evaluate_epd(epd: str, depth: int) -> int:
+    """在工作进程中评估局面, 返回走棋方视角的厘兵分数"""
+    board, _ = chess.Board.from_epd(epd)
+    if board.is_checkmate():
+        return -MATE_SCORE
+    if board.is_stalemate() or board.is_insufficient_material():
+        return 0
+    info = _engine.analyse(board, chess.engine.Limit(depth=depth))
+    return info["score"].pov(board.turn).score(mate_score=MATE_SCORE)
+
+
+def win_percent(cp: int) -> float:
+    """把厘兵分数换算为胜率 (0-100), 与 lichess 的换算一致"""
+    return 50 + 50 * (2 / (1 + math.exp(-0.00368208 * cp)) - 1)
+
+
+def move_accuracy(win_before: float, win_after: float) -> float:
+    """按走子方胜率的下降计算单步准确率 (0-100)"""
+    accuracy = 103.1668 * math.exp(-0.04354 * max(win_before - win_after, 0)) - 3.1669
+    return min(max(accuracy, 0.0), 100.0)
+
+
+class MoveAnalyzer:
+    """后台引擎评估池, 带 FEN 缓存和在途数量上限"""
+
+    def __init__(
+        self,
+        engine_path: str = "stockfish",
+        depth: int = 12,
+        workers: int = 2,
+        max_pending: int = 32,
+        cache_size: int = 100_000,
+    ):
+        self.depth = depth
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(engine_path,)
+        )
+        self.cache: "OrderedDict[str, int]" = OrderedDict()
+        self.inflight: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.stats = {"evaluated": 0, "cache_hits": 0, "dropped": 0}
+
+    def evaluate(self, epd: str) -> Optional[Future]:
+        """
+        不阻塞地请求一个局面的评估。
+
+        Returns:
+            Optional[Future]: 评估结果的 Future; 在途评估已满或引擎池不可用时为 None
+        """
+        with self.lock:
+            if epd in self.cache:
+                self.cache.move_to_end(epd)
+                self.stats["cache_hits"] += 1
+                future = Future()
+                future.set_result(self.cache[epd])
+                return future
+            if epd in self.inflight:
+                self.stats["cache_hits"] += 1
+                return self.inflight[epd]
+            if len(self.inflight) >= self.max_pending:
+                self.stats["dropped"] += 1
+                return None
+            try:
+                future = self.pool.submit(_evaluate_epd, epd, self.depth)
+            except Exception as e:
+                # A bad engine path or crashed engine breaks the pool; analysis must never block a move
+                self.stats["dropped"] += 1
+                logger.warning("engine analysis unavailable: %s", e)
+                return None
+            self.inflight[epd] = future
+        future.add_done_callback(lambda f: self._store(epd, f))
+        return future
+
+    def _store(self, epd: str, future: Future):
+        with self.lock:
+            self.inflight.pop(epd, None)
+            if not future.cancelled() and future.exception() is None:
+                self.cache[epd] = future.result()
+                self.stats["evaluated"] += 1
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class GameAnalysis:
+    """一局棋的走法质量记录"""
+
+    def __init__(self, analyzer: MoveAnalyzer):
+        self.analyzer = analyzer
+        self.moves: List[Dict] = []
+
+    def add_move(self, board_before: chess.Board, move: chess.Move):
+        """在走子前调用; 请求走子前后两个局面的评估, 立即返回"""
+        board_after = board_before.copy(stack=False)
+        board_after.push(move)
+        self.moves.append(
+            {
+                "ply": board_before.ply() + 1,
+                "side": "white" if board_before.turn == chess.WHITE else "black",
+                "move": move.uci(),
+                "before": self.analyzer.evaluate(board_before.epd()),
+                "after": self.analyzer.evaluate(board_after.epd()),
+            }
+        )
+
+    def rows(self) -> List[Dict]:
+        """已完成评估的走法: 厘兵损失和准确率, 均为走子方视角"""
+        rows = []
+        for record in self.moves:
+            before, after = record["before"], record["after"]
+            if before is None or after is None or not (before.done() and after.done()):
+                continue
+            # Futures cancelled by close() raise CancelledError from exception()
+            if before.cancelled() or after.cancelled():
+                continue
+            if before.exception() or after.exception():
+                continue
+            cp_before = before.result()
+            # The position after the move is scored for the opponent
+            cp_after = -after.result()
+            rows.append(
+                {
+                    "ply": record["ply"],
+                    "side": record["side"],
+                    "move": record["move"],
+                    "cp_before": cp_before,
+                    "cp_after": cp_after,
+                    "cp_loss": max(cp_before - cp_after, 0),
+                    "accuracy": round(
+                        move_accuracy(win_percent(cp_before), win_percent(cp_after)), 1
+                    ),
+                }
+            )
+        return rows
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """每一方的平均厘兵损失 (acpl)、准确率和已分析步数"""
+        summary = {}
+        rows = self.rows()
+        for side in ("white", "black"):
+            side_rows = [row for row in rows if row["side"] == side]
+            summary[side] = {
+                "analyzed": len(side_rows),
+                "acpl": round(sum(r["cp_loss"] for r in side_rows) / len(side_rows), 1)
+                if side_rows
+                else None,
+                "accuracy": round(sum(r["accuracy"] for r in side_rows) / len(side_rows), 1)
+                if side_rows
+                else None,
+            }
+        return summary
+
+    def wait(self, timeout: Optional[float] = None):
+        """等待所有已提交的评估完成 (只在对局结束后使用)"""
+        futures = [
+            f for record in self.moves for f in (record["before"], record["after"]) if f is not None
+        ]
+        wait(futures, timeout=timeout)
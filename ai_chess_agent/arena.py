@@ -0,0 +1,426 @@
+"""
+无界面的多局象棋对战场
+---------------------------------
+每局棋是一个独立的 ChessGame 对象(自己的 chess.Board 和工具函数)，不依赖 Streamlit。
+多局棋在线程池中并发进行，结束的对局实时追加到 PGN 文件，指标追加到 CSV 文件
+(每秒移动数、每步 token 数、非法移动尝试次数)。
+
+每个提供者的并发模型请求数由各自的信号量限制: 每次模型调用只占用走棋一方提供者的信号量，
+一局棋不会在等待对手时占用另一个提供者的配额。
+
+使用示例:
+---------------
+python arena.py qwen:qwen-plus-latest deepseek:deepseek-chat --games 20 \\
+    --limit qwen=4 --limit deepseek=2 --max-turns 200
+"""
+
+import argparse
+import csv
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import chess
+import chess.pgn
+from autogen import ConversableAgent, gather_usage_summary, register_function
+
+from analysis import GameAnalysis, MoveAnalyzer
+from oracle import MoveOracle, register_oracle
+
+PROVIDERS = {
+    "qwen": ("QWEN_API_KEY", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
+    "deepseek": ("DEEPSEEK_API_KEY", "https://api.deepseek.com"),
+    "openai": ("OPENAI_API_KEY", None),
+}
+
+METRIC_FIELDS = [
+    "game_id",
+    "white",
+    "black",
+    "result",
+    "termination",
+    "moves",
+    "duration_s",
+    "moves_per_s",
+    "tokens",
+    "tokens_per_move",
+    "illegal_white",
+    "illegal_black",
+    "acpl_white",
+    "acpl_black",
+    "accuracy_white",
+    "accuracy_black",
+    "error",
+]
+
+DEFAULT_PROVIDER_LIMIT = 2
+
+
+def limit_model_calls(agent: ConversableAgent, semaphore: threading.Semaphore):
+    """让代理的每次模型调用都在 semaphore 内进行"""
+    create = agent.client.create
+
+    def limited_create(*args, **kwargs):
+        with semaphore:
+            return create(*args, **kwargs)
+
+    agent.client.create = limited_create
+
+
+def get_llm_config(spec: str) -> Dict:
+    """把 `provider:model` 转换为 AutoGen 的 llm_config"""
+    provider, model = spec.split(":", 1)
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unsupported model provider: {provider}")
+    env_key, base_url = PROVIDERS[provider]
+    config = {"model": model, "api_key": os.environ[env_key]}
+    if base_url:
+        config["base_url"] = base_url
+    return {"config_list": [config], "cache_seed": None}
+
+
+class ChessGame:
+    """一局棋: 自己的棋盘、工具函数和 AutoGen 代理"""
+
+    def __init__(
+        self,
+        game_id: int,
+        white: str,
+        black: str,
+        max_turns: int = 200,
+        oracle: Optional[MoveOracle] = None,
+        oracle_sides: tuple = (),
+        analyzer: Optional[MoveAnalyzer] = None,
+        limits: Optional[Dict[str, threading.Semaphore]] = None,
+    ):
+        self.game_id = game_id
+        self.white = white
+        self.black = black
+        self.max_turns = max_turns
+        self.oracle = oracle
+        self.oracle_sides = oracle_sides
+        self.analysis = GameAnalysis(analyzer) if analyzer is not None else None
+        # Per-provider semaphores, held only for the duration of each model call
+        self.limits = limits or {}
+        self.board = chess.Board()
+        self.made_move = False
+        self.illegal = {chess.WHITE: 0, chess.BLACK: 0}
+
+    def available_moves(self) -> str:
+        return "可用的移动是: " + ",".join(move.uci() for move in self.board.legal_moves)
+
+    def execute_move(self, move: str) -> str:
+        try:
+            chess_move = chess.Move.from_uci(move)
+        except ValueError:
+            self.illegal[self.board.turn] += 1
+            return f"无效的移动格式: {move}. 请使用UCI格式 (e.g., 'e2e4')."
+        if chess_move not in self.board.legal_moves:
+            self.illegal[self.board.turn] += 1
+            return f"无效的移动: {move}. 请调用 available_moves() 查看有效的移动。"
+
+        if self.analysis is not None:
+            self.analysis.add_move(self.board, chess_move)
+        self.board.push(chess_move)
+        self.made_move = True
+        move_desc = f"Moved {move}."
+        if self.board.is_game_over():
+            move_desc += f"\n游戏结束: {self.board.result()}"
+        elif self.board.is_check():
+            move_desc += "\n将军!"
+        return move_desc
+
+    def execute_oracle_move(self, move: str) -> str:
+        # The oracle bypasses the nested chat, so nothing will consume made_move
+        move_desc = self.execute_move(move)
+        self.made_move = False
+        return move_desc
+
+    def check_made_move(self, msg) -> bool:
+        if self.made_move:
+            self.made_move = False
+            return True
+        return False
+
+    def _build_agents(self):
+        def is_game_over(msg) -> bool:
+            return self.board.is_game_over()
+
+        agent_white = ConversableAgent(
+            name="Agent_White",
+            system_message="你是一个专业的象棋玩家，你扮演白棋。 "
+            "首先调用 available_moves() 获取合法的移动列表。 "
+            "然后调用 execute_move(move) 来执行移动。",
+            llm_config=get_llm_config(self.white),
+            is_termination_msg=is_game_over,
+        )
+        agent_black = ConversableAgent(
+            name="Agent_Black",
+            system_message="你是一个专业的象棋玩家，你扮演黑棋。 "
+            "首先调用 available_moves() 获取合法的移动列表。 "
+            "然后调用 execute_move(move) 来执行移动。",
+            llm_config=get_llm_config(self.black),
+            is_termination_msg=is_game_over,
+        )
+        for agent, spec in ((agent_white, self.white), (agent_black, self.black)):
+            provider = spec.split(":")[0]
+            if provider in self.limits:
+                limit_model_calls(agent, self.limits[provider])
+        game_master = ConversableAgent(
+            name="Game_Master",
+            llm_config=False,
+            is_termination_msg=self.check_made_move,
+            default_auto_reply="请做出移动",
+            human_input_mode="NEVER",
+        )
+
+        for player in (agent_white, agent_black):
+            register_function(
+                self.execute_move,
+                caller=player,
+                executor=game_master,
+                name="execute_move",
+                description="调用此工具来做出移动",
+            )
+            register_function(
+                self.available_moves,
+                caller=player,
+                executor=game_master,
+                name="available_moves",
+                description="获取合法的移动列表",
+            )
+
+        agent_white.register_nested_chats(
+            trigger=agent_black,
+            chat_queue=[
+                {"sender": game_master, "recipient": agent_white, "summary_method": "last_msg"}
+            ],
+        )
+        agent_black.register_nested_chats(
+            trigger=agent_white,
+            chat_queue=[
+                {"sender": game_master, "recipient": agent_black, "summary_method": "last_msg"}
+            ],
+        )
+
+        if self.oracle is not None:
+            if chess.WHITE in self.oracle_sides:
+                register_oracle(
+                    agent_white, agent_black, self.oracle,
+                    lambda: self.board, self.execute_oracle_move,
+                )
+            if chess.BLACK in self.oracle_sides:
+                register_oracle(
+                    agent_black, agent_white, self.oracle,
+                    lambda: self.board, self.execute_oracle_move,
+                )
+        return agent_white, agent_black
+
+    def play(self) -> Dict:
+        """下完这一局(或达到 max_turns), 返回指标"""
+        agent_white, agent_black = self._build_agents()
+        started = time.perf_counter()
+        agent_black.initiate_chat(
+            recipient=agent_white,
+            message="让我们下棋! 你先走, 轮到你了。",
+            max_turns=self.max_turns,
+            silent=True,
+        )
+        duration = time.perf_counter() - started
+
+        usage = gather_usage_summary([agent_white, agent_black])
+        tokens = sum(
+            model_usage.get("total_tokens", 0)
+            for name, model_usage in usage["usage_including_cached_inference"].items()
+            if name != "total_cost"
+        )
+        moves = len(self.board.move_stack)
+        outcome = self.board.outcome()
+        return {
+            "game_id": self.game_id,
+            "white": self.white,
+            "black": self.black,
+            "result": self.board.result(claim_draw=True),
+            "termination": outcome.termination.name if outcome else "MAX_TURNS",
+            "moves": moves,
+            "duration_s": round(duration, 3),
+            "moves_per_s": round(moves / duration, 4) if duration else 0,
+            "tokens": tokens,
+            "tokens_per_move": round(tokens / moves, 1) if moves else 0,
+            "illegal_white": self.illegal[chess.WHITE],
+            "illegal_black": self.illegal[chess.BLACK],
+            "error": "",
+        }
+
+    def move_quality(self, timeout: float = 60) -> Dict:
+        """等待本局的引擎分析完成 (最多 timeout 秒), 返回双方的平均厘兵损失和准确率"""
+        if self.analysis is None:
+            return {}
+        self.analysis.wait(timeout=timeout)
+        summary = self.analysis.summary()
+        quality = {}
+        for side in ("white", "black"):
+            quality[f"acpl_{side}"] = summary[side]["acpl"]
+            quality[f"accuracy_{side}"] = summary[side]["accuracy"]
+        return quality
+
+    def to_pgn(self) -> chess.pgn.Game:
+        game = chess.pgn.Game.from_board(self.board)
+        game.headers["Event"] = "LLM Arena"
+        game.headers["Round"] = str(self.game_id + 1)
+        game.headers["White"] = self.white
+        game.headers["Black"] = self.black
+        game.headers["Result"] = self.board.result(claim_draw=True)
+        return game
+
+
+def run_arena(
+    model_a: str,
+    model_b: str,
+    games: int = 10,
+    pgn_path: Path = Path("arena.pgn"),
+    metrics_path: Path = Path("arena_metrics.csv"),
+    provider_limits: Optional[Dict[str, int]] = None,
+    max_turns: int = 200,
+    alternate: bool = True,
+    oracle: Optional[MoveOracle] = None,
+    oracle_sides: tuple = (chess.WHITE, chess.BLACK),
+    analyzer: Optional[MoveAnalyzer] = None,
+) -> List[Dict]:
+    """
+    并发进行多局对战, 每局结束后立即写入 PGN 和指标 CSV。
+
+    Args:
+        model_a: 偶数局执白的 `provider:model`
+        model_b: 偶数局执黑的 `provider:model`
+        games: 对局数量
+        pgn_path: PGN 输出文件 (追加写入)
+        metrics_path: 指标 CSV 输出文件 (追加写入)
+        provider_limits: 每个提供者同时进行的模型请求数 (默认各 2)
+        max_turns: 每局最大对话轮数
+        alternate: 每隔一局交换先后手
+        oracle: 本地开局库/残局库, 命中时不调用模型
+        oracle_sides: 使用走法库的一方 (chess.WHITE / chess.BLACK)
+        analyzer: 本地引擎分析池, 在各局之间共享评估缓存
+
+    Returns:
+        List[Dict]: 每局的指标, 按对局编号排序
+    """
+    provider_limits = dict(provider_limits or {})
+    for spec in (model_a, model_b):
+        provider_limits.setdefault(spec.split(":")[0], DEFAULT_PROVIDER_LIMIT)
+    limits = {provider: threading.Semaphore(n) for provider, n in provider_limits.items()}
+
+    rows = []
+    write_header = not metrics_path.exists()
+    with ThreadPoolExecutor(max_workers=sum(provider_limits.values())) as pool, pgn_path.open(
+        "a", encoding="utf-8"
+    ) as pgn_file, metrics_path.open("a", newline="", encoding="utf-8") as metrics_file:
+        writer = csv.DictWriter(metrics_file, fieldnames=METRIC_FIELDS)
+        if write_header:
+            writer.writeheader()
+
+        futures = {}
+        for game_id in range(games):
+            white, black = (model_b, model_a) if alternate and game_id % 2 else (model_a, model_b)
+            game = ChessGame(
+                game_id, white, black, max_turns=max_turns,
+                oracle=oracle, oracle_sides=oracle_sides, analyzer=analyzer, limits=limits,
+            )
+            futures[pool.submit(game.play)] = game
+
+        # Results are written from this thread only, as each game finishes
+        for future in as_completed(futures):
+            game = futures[future]
+            try:
+                row = future.result()
+                # Wait for the engine here, not in a pool worker that could be playing another game
+                row.update(game.move_quality())
+            except Exception as e:
+                row = {field: "" for field in METRIC_FIELDS}
+                row.update(game_id=game.game_id, white=game.white, black=game.black, error=str(e))
+            print(game.to_pgn(), file=pgn_file, end="\n\n")
+            pgn_file.flush()
+            writer.writerow(row)
+            metrics_file.flush()
+            rows.append(row)
+            print(f"对局 {row['game_id']}: {row['white']} vs {row['black']} {row['result']}")
+
+    return sorted(rows, key=lambda row: row["game_id"])
+
+
+def _parse_limit(value: str) -> tuple:
+    provider, _, limit = value.partition("=")
+    return provider, int(limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面的多局象棋对战场")
+    parser.add_argument("model_a", help="例如 qwen:qwen-plus-latest")
+    parser.add_argument("model_b", help="例如 deepseek:deepseek-chat")
+    parser.add_argument("--games", type=int, default=10, help="对局数量")
+    parser.add_argument("--pgn", type=Path, default=Path("arena.pgn"), help="PGN 输出文件")
+    parser.add_argument(
+        "--metrics", type=Path, default=Path("arena_metrics.csv"), help="指标 CSV 输出文件"
+    )
+    parser.add_argument(
+        "--limit",
+        type=_parse_limit,
+        action="append",
+        default=[],
+        metavar="PROVIDER=N",
+        help="每个提供者的最大并发请求数",
+    )
+    parser.add_argument("--max-turns", type=int, default=200, help="每局最大对话轮数")
+    parser.add_argument("--no-alternate", action="store_true", help="不交换先后手")
+    parser.add_argument("--book", help="Polyglot 开局库文件 (.bin)")
+    parser.add_argument("--book-plies", type=int, default=16, help="开局库使用的最大步数 (ply)")
+    parser.add_argument("--tablebase", help="Syzygy 残局库目录")
+    parser.add_argument(
+        "--oracle-side", choices=["white", "black", "both"], default="both",
+        help="哪一方使用本地走法库",
+    )
+    parser.add_argument("--engine", help="用于走法质量分析的 UCI 引擎, 如 stockfish")
+    parser.add_argument("--engine-depth", type=int, default=12, help="分析深度")
+    parser.add_argument("--engine-workers", type=int, default=2, help="引擎进程数")
+    args = parser.parse_args()
+
+    analyzer = None
+    if args.engine:
+        analyzer = MoveAnalyzer(args.engine, depth=args.engine_depth, workers=args.engine_workers)
+
+    oracle = None
+    if args.book or args.tablebase:
+        oracle = MoveOracle(args.book, args.tablebase, args.book_plies)
+    oracle_sides = {
+        "white": (chess.WHITE,),
+        "black": (chess.BLACK,),
+        "both": (chess.WHITE, chess.BLACK),
+    }[args.oracle_side]
+
+    run_arena(
+        args.model_a,
+        args.model_b,
+        games=args.games,
+        pgn_path=args.pgn,
+        metrics_path=args.metrics,
+        provider_limits=dict(args.limit),
+        max_turns=args.max_turns,
+        alternate=not args.no_alternate,
+        oracle=oracle,
+        oracle_sides=oracle_sides,
+        analyzer=analyzer,
+    )
+    if analyzer is not None:
+        print(f"引擎分析: {analyzer.stats}")
+        analyzer.close()
+    if oracle is not None:
+        print(f"本地走法库命中: {oracle.stats}")
+        oracle.close()
+
+
+if __name__ == "__main__":
+    main()
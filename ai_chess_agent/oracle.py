@@ -0,0 +1,135 @@
+"""
+本地走法库: Polyglot 开局库 + Syzygy 残局库
+---------------------------------
+在开局库覆盖的前 N 步和残局库覆盖的少子局面中, 直接由本地文件给出走法,
+不再调用模型。两种文件都由 python-chess 以内存映射方式打开。
+
+register_oracle() 把走法库注册为玩家代理的最高优先级回复函数: 命中时直接执行走法并回复,
+跳过 Game_Master 的嵌套对话; 未命中时回退到原来的模型回合。
+"""
+
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import chess
+import chess.polyglot
+import chess.syzygy
+
+
+class MoveOracle:
+    """从本地开局库和残局库中查找走法"""
+
+    def __init__(
+        self,
+        book_path: Optional[str] = None,
+        tablebase_dir: Optional[str] = None,
+        max_book_plies: int = 16,
+    ):
+        self.book = (
+            chess.polyglot.open_reader(book_path)
+            if book_path and Path(book_path).is_file()
+            else None
+        )
+        self.tablebase = (
+            chess.syzygy.open_tablebase(tablebase_dir)
+            if tablebase_dir and Path(tablebase_dir).is_dir()
+            else None
+        )
+        self.max_book_plies = max_book_plies
+        self.stats: Dict[str, int] = {"book": 0, "tablebase": 0}
+
+    @property
+    def max_pieces(self) -> int:
+        """残局库支持的最大棋子数 (含双王), 没有残局库时为 0"""
+        if self.tablebase is None:
+            return 0
+        return max(len(name) - 1 for name in self.tablebase.wdl) if self.tablebase.wdl else 0
+
+    def book_move(self, board: chess.Board) -> Optional[chess.Move]:
+        """开局库中权重最高的走法"""
+        if self.book is None or board.ply() >= self.max_book_plies:
+            return None
+        try:
+            return self.book.find(board).move
+        except IndexError:
+            return None
+
+    def tablebase_move(self, board: chess.Board) -> Optional[chess.Move]:
+        """
+        残局库中的最佳走法: 先比较胜/和/负, 胜势下选离吃子或将杀最近的走法,
+        败势下选抵抗最久的走法。
+        """
+        if self.tablebase is None or chess.popcount(board.occupied) > self.max_pieces:
+            return None
+
+        best_move, best_key = None, None
+        for move in board.legal_moves:
+            board.push(move)
+            try:
+                if board.is_checkmate():
+                    key = (True, 2, 0)
+                else:
+                    wdl = -self.tablebase.probe_wdl(board)
+                    dtz = abs(self.tablebase.probe_dtz(board))
+                    key = (False, wdl, -dtz if wdl > 0 else dtz)
+            except KeyError:
+                # Missing table for this material: let the model play
+                return None
+            finally:
+                board.pop()
+            if best_key is None or key > best_key:
+                best_move, best_key = move, key
+        return best_move
+
+    def probe(self, board: chess.Board) -> Optional[Tuple[chess.Move, str]]:
+        """
+        Returns:
+            Optional[Tuple[chess.Move, str]]: (走法, 来源 "book"/"tablebase"), 未命中为 None
+        """
+        move = self.book_move(board)
+        if move is not None:
+            self.stats["book"] += 1
+            return move, "book"
+        move = self.tablebase_move(board)
+        if move is not None:
+            self.stats["tablebase"] += 1
+            return move, "tablebase"
+        return None
+
+    def close(self):
+        if self.book is not None:
+            self.book.close()
+        if self.tablebase is not None:
+            self.tablebase.close()
+
+
+def register_oracle(
+    player,
+    trigger,
+    oracle: MoveOracle,
+    get_board: Callable[[], chess.Board],
+    execute_move: Callable[[str], str],
+):
+    """
+    把走法库注册为 player 在收到 trigger 消息时的第一个回复函数。
+
+    Args:
+        player: 使用走法库的一方 (ConversableAgent)
+        trigger: 对手代理, 它的消息会触发本方回合
+        oracle: 走法库
+        get_board: 返回当前棋盘
+        execute_move: 执行 UCI 走法并返回走法描述, 与模型调用的工具相同
+    """
+
+    def oracle_reply(recipient, messages=None, sender=None, config=None):
+        board = get_board()
+        if board.is_game_over():
+            return False, None
+        hit = oracle.probe(board)
+        if hit is None:
+            return False, None
+        move, source = hit
+        return True, f"[{source}] {execute_move(move.uci())}"
+
+    # position=0 puts it ahead of the nested Game_Master chat
+    player.register_reply(trigger=trigger, reply_func=oracle_reply, position=0)
@@ -3,6 +3,22 @@ from firecrawl import FirecrawlApp
 from typing import Dict, Any
 import streamlit as st
 
+from research_cache import ResearchCache
+from source_index import SourceIndex
+
+
+@st.cache_resource
+def get_research_cache() -> ResearchCache:
+    """Research result cache shared by every call in this process; entries persist on disk."""
+    return ResearchCache()
+
+
+@st.cache_resource
+def get_source_index() -> SourceIndex:
+    """Local index of every crawled source, so later runs can search it."""
+    return SourceIndex()
+
+
 # Keep the original deep_research tool
 @tool
 def deep_research(query: str, max_depth: int, time_limit: int, max_urls: int) -> Dict[str, Any]:
@@ -19,6 +35,18 @@ def deep_research(query: str, max_depth: int, time_limit: int, max_urls: int) ->
         Dict[str, Any]: A dictionary containing the final analysis, the number of sources found, and the sources themselves.
     """
     try:
+        # Identical query and parameters: reuse the stored result instead of crawling again
+        research_cache = get_research_cache()
+        cached = research_cache.get(query, max_depth, time_limit, max_urls)
+        if cached is not None:
+            return {
+                "success": True,
+                "cached": True,
+                "final_analysis": cached['final_analysis'],
+                "sources_count": len(cached['sources']),
+                "sources": cached['sources']
+            }
+
         # Initialize FirecrawlApp with the API key from session state
         firecrawl_app = FirecrawlApp(api_key=st.session_state.firecrawl_api_key)
         
@@ -41,6 +69,12 @@ def deep_research(query: str, max_depth: int, time_limit: int, max_urls: int) ->
                 on_activity=on_activity
             )
         
+        research_cache.put(query, max_depth, time_limit, max_urls, {
+            "final_analysis": results['data']['finalAnalysis'],
+            "sources": results['data']['sources']
+        })
+        get_source_index().add(query, results['data']['sources'], results['data']['finalAnalysis'])
+        
         return {
             "success": True,
             "final_analysis": results['data']['finalAnalysis'],
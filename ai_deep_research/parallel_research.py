@@ -0,0 +1,172 @@
+"""
+并行子查询研究
+
+把一个宽泛的问题拆成的多个子查询同时交给 Firecrawl 深度研究, 墙钟时间接近最慢的一个子查询,
+而不是所有子查询之和。
+
+- 全局预算: max_urls 在子查询之间平均分配; 全部子查询共享同一个 time_limit,
+  超过 time_limit + GRACE_SECONDS 仍未完成的子查询被放弃
+- 每个子查询先查研究缓存, 完成后写入研究缓存和本地资料库
+- 各子查询的来源按规范化 URL 去重后合并
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from research_cache import ResearchCache
+from source_index import SourceIndex
+
+MAX_SUB_QUERIES = 5
+GRACE_SECONDS = 30
+
+
+def normalize_url(url: str) -> str:
+    """忽略协议大小写、www 前缀、末尾斜杠和锚点"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return urlunsplit((parts.scheme.lower(), host, parts.path.rstrip("/"), parts.query, ""))
+
+
+def merge_sources(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """按规范化 URL 去重, 保留第一次出现的来源并记录它来自哪些子查询"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for result in results:
+        for source in result["sources"]:
+            key = normalize_url(source.get("url", "")) or source.get("title", "")
+            if key in merged:
+                merged[key]["sub_queries"].append(result["query"])
+            else:
+                merged[key] = {**source, "sub_queries": [result["query"]]}
+    return list(merged.values())
+
+
+async def _crawl(
+    firecrawl_app,
+    query: str,
+    max_depth: int,
+    time_limit: int,
+    max_urls: int,
+    executor: ThreadPoolExecutor,
+    activities: List[tuple],
+) -> Dict[str, Any]:
+    # The SDK call is blocking; activity callbacks come from the worker thread
+    results = await asyncio.get_running_loop().run_in_executor(
+        executor,
+        partial(
+            firecrawl_app.deep_research,
+            query=query,
+            max_depth=max_depth,
+            time_limit=time_limit,
+            max_urls=max_urls,
+            on_activity=lambda activity: activities.append((query, activity)),
+        ),
+    )
+    return {
+        "final_analysis": results["data"]["finalAnalysis"],
+        "sources": results["data"]["sources"],
+    }
+
+
+async def run_parallel_research(
+    firecrawl_app,
+    sub_queries: List[str],
+    max_depth: int,
+    time_limit: int,
+    max_urls: int,
+    research_cache: Optional[ResearchCache] = None,
+    source_index: Optional[SourceIndex] = None,
+    reuse_cached: bool = True,
+    max_concurrency: int = MAX_SUB_QUERIES,
+    on_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    并行研究多个子查询并合并结果
+
+    Args:
+        max_urls: 所有子查询合计的 URL 上限
+        time_limit: 所有子查询共享的时间上限 (秒)
+        reuse_cached: 为 False 时不读取研究缓存, 但仍然写入新结果
+        on_done: 每个子查询结束 (完成、失败或超时) 时在事件循环线程中调用
+
+    Returns:
+        Dict[str, Any]: sub_queries (各子查询的状态), final_analysis (按子查询分节), sources (去重后), elapsed
+    """
+    started = time.monotonic()
+    sub_queries = list(dict.fromkeys(q.strip() for q in sub_queries if q.strip()))
+    sub_queries = sub_queries[: min(MAX_SUB_QUERIES, max(max_urls, 1))]
+    per_query_urls = max(max_urls // max(len(sub_queries), 1), 1)
+
+    results: List[Dict[str, Any]] = []
+
+    def finish(result: Dict[str, Any]):
+        results.append(result)
+        if on_done is not None:
+            on_done(result)
+
+    # Own executor: asyncio.run() would otherwise wait for abandoned crawls on exit
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    activities: List[tuple] = []
+    tasks = {}
+    for query in sub_queries:
+        cached = None
+        if research_cache is not None and reuse_cached:
+            cached = research_cache.get(query, max_depth, time_limit, per_query_urls)
+        if cached is not None:
+            finish({"query": query, "status": "cached", **cached})
+            continue
+        task = asyncio.create_task(
+            _crawl(firecrawl_app, query, max_depth, time_limit, per_query_urls, executor, activities)
+        )
+        tasks[task] = query
+
+    deadline = started + time_limit + GRACE_SECONDS
+    pending = set(tasks)
+    while pending:
+        timeout = max(deadline - time.monotonic(), 0)
+        done, pending = await asyncio.wait(
+            pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        if not done:
+            break
+        for task in done:
+            query = tasks[task]
+            if task.exception() is not None:
+                status = f"error: {task.exception()}"
+                finish({"query": query, "status": status, "final_analysis": "", "sources": []})
+                continue
+            result = task.result()
+            if research_cache is not None:
+                research_cache.put(query, max_depth, time_limit, per_query_urls, result)
+            if source_index is not None:
+                source_index.add(query, result["sources"], result["final_analysis"])
+            finish({"query": query, "status": "ok", **result})
+
+    for task in pending:
+        # Threads cannot be interrupted; the crawl finishes in the background and is ignored
+        task.cancel()
+        finish({"query": tasks[task], "status": "timeout", "final_analysis": "", "sources": []})
+    executor.shutdown(wait=False)
+
+    # Keep the planner's order rather than completion order
+    results.sort(key=lambda result: sub_queries.index(result["query"]))
+    sources = merge_sources(results)
+    return {
+        "success": any(result["status"] in ("ok", "cached") for result in results),
+        "sub_queries": [
+            {"query": r["query"], "status": r["status"], "sources_count": len(r["sources"])}
+            for r in results
+        ],
+        "final_analysis": "\n\n".join(
+            f"### 子问题：{r['query']}\n{r['final_analysis']}" for r in results if r["final_analysis"]
+        ),
+        "sources_count": len(sources),
+        "sources": sources,
+        "activities": len(activities),
+        "elapsed": round(time.monotonic() - started, 1),
+    }
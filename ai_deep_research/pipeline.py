@@ -0,0 +1,69 @@
+"""
+研究 → 阐述流水线
+
+研究报告以流式输出, 每当一个 "## " 二级标题开始, 上一节就视为完整,
+立即在后台线程中交给阐述智能体, 不必等待整篇报告完成。
+
+- iter_content(): 从 agent.run(stream=True) 的事件流中取出文本增量
+- SectionPipeline: 跟踪报告中已完成的章节并提交阐述任务
+"""
+
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+# Sections that are not worth elaborating on
+SKIP_SECTIONS = ("参考来源",)
+
+_HEADING = re.compile(r"^## ", re.MULTILINE)
+
+
+def iter_content(stream: Iterable) -> Iterator[str]:
+    """流式运行事件中的文本增量; 跳过工具调用等不带文本的事件和结束时汇总全文的事件"""
+    for event in stream:
+        content = getattr(event, "content", None)
+        if not isinstance(content, str) or not content:
+            continue
+        if "Completed" in str(getattr(event, "event", "")):
+            continue
+        yield content
+
+
+def split_sections(text: str) -> List[str]:
+    """按二级标题切分报告, 第一个二级标题之前的内容 (标题等) 不算章节"""
+    starts = [match.start() for match in _HEADING.finditer(text)]
+    return [text[start:end].strip() for start, end in zip(starts, starts[1:] + [len(text)])]
+
+
+def section_title(section: str) -> str:
+    return section.splitlines()[0].lstrip("#").strip()
+
+
+class SectionPipeline:
+    """随着报告流入, 把已完成的章节提交给 elaborate 并行阐述"""
+
+    def __init__(self, elaborate: Callable[[str], str], max_workers: int = 3):
+        self.elaborate = elaborate
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.sections: List[Tuple[str, Future]] = []
+        self.seen = 0
+
+    def _submit(self, sections: List[str]):
+        for section in sections[self.seen :]:
+            title = section_title(section)
+            if not any(skip in title for skip in SKIP_SECTIONS):
+                self.sections.append((title, self.executor.submit(self.elaborate, section)))
+        self.seen = max(self.seen, len(sections))
+
+    def feed(self, text: str):
+        """传入目前为止的报告全文; 最后一节可能还没写完, 不提交"""
+        self._submit(split_sections(text)[:-1])
+
+    def finish(self, text: str):
+        """报告结束, 提交最后一节"""
+        self._submit(split_sections(text))
+        self.executor.shutdown(wait=False)
+
+    @property
+    def done(self) -> int:
+        return sum(future.done() for _, future in self.sections)
@@ -0,0 +1,140 @@
+"""
+深度研究结果缓存
+
+按 (规范化查询, max_depth, time_limit, max_urls) 把 Firecrawl 深度研究的最终分析和完整来源列表
+保存在本地 SQLite 中。命中时直接返回, 不再发起 60-300 秒的爬取。
+
+- 过期: 读取时忽略超过 TTL 的条目; 写入时顺带删除超过最长 TTL (MAX_TTL) 的条目,
+  调用方在 get 时可以使用比默认值更长的 TTL
+- 大小: 总大小超过上限时, 按最近访问时间淘汰最旧的条目
+
+缓存目录默认是 ~/.cache/ai_deep_research, 可通过环境变量 DEEP_RESEARCH_CACHE_DIR 修改。
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+CACHE_DIR = Path(
+    os.environ.get("DEEP_RESEARCH_CACHE_DIR", Path.home() / ".cache" / "ai_deep_research")
+)
+DEFAULT_TTL = 7 * 24 * 3600
+# Longest TTL a caller may pass to get(); entries are only purged once they are older than this
+MAX_TTL = 30 * 24 * 3600
+
+
+def normalize_query(query: str) -> str:
+    """忽略大小写、空白和句末标点的差异"""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?？.。!！ ")
+
+
+def research_key(query: str, max_depth: int, time_limit: int, max_urls: int) -> str:
+    params = [normalize_query(query), int(max_depth), int(time_limit), int(max_urls)]
+    return hashlib.sha256(json.dumps(params, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResearchCache:
+    """SQLite 中带 TTL 和总大小上限的研究结果缓存"""
+
+    def __init__(
+        self,
+        path: Path = CACHE_DIR / "research.sqlite3",
+        ttl: float = DEFAULT_TTL,
+        max_bytes: int = 200 * 1024 * 1024,
+    ):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS research (
+                    key TEXT PRIMARY KEY,
+                    query TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call, so Streamlit threads never share one
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(
+        self, query: str, max_depth: int, time_limit: int, max_urls: int, ttl: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Returns:
+            Optional[Dict[str, Any]]: final_analysis, sources, created; 未命中或已过期为 None
+        """
+        key = research_key(query, max_depth, time_limit, max_urls)
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        with self.lock, self._connect() as connection:
+            row = connection.execute(
+                "SELECT result, created FROM research WHERE key = ? AND created >= ?",
+                (key, now - ttl),
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            connection.execute("UPDATE research SET accessed = ? WHERE key = ?", (now, key))
+            self.stats["hits"] += 1
+        result = json.loads(row[0])
+        result["created"] = row[1]
+        return result
+
+    def put(self, query: str, max_depth: int, time_limit: int, max_urls: int, result: Dict[str, Any]):
+        """保存一次研究的 final_analysis 和完整的 sources, 然后删除过期条目并按大小淘汰"""
+        payload = json.dumps(
+            {"final_analysis": result["final_analysis"], "sources": result["sources"]},
+            ensure_ascii=False,
+        )
+        size = len(payload.encode("utf-8"))
+        now = time.time()
+        with self.lock, self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO research (key, query, result, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (research_key(query, max_depth, time_limit, max_urls), query, payload, size, now, now),
+            )
+            # Purge with the longest allowed TTL, not the default: get() callers may pass a longer one
+            connection.execute(
+                "DELETE FROM research WHERE created < ?", (now - max(self.ttl, MAX_TTL),)
+            )
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM research").fetchone()[0]
+            if total > self.max_bytes:
+                # Least recently accessed first
+                for key, entry_size in connection.execute(
+                    "SELECT key, size FROM research ORDER BY accessed"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    connection.execute("DELETE FROM research WHERE key = ?", (key,))
+                    total -= entry_size
+                    self.stats["evictions"] += 1
+
+    def info(self) -> Dict[str, Any]:
+        """条目数、总大小和本进程的命中统计"""
+        with self._connect() as connection:
+            entries, size = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM research"
+            ).fetchone()
+        return {"entries": entries, "bytes": size, **self.stats}
+
+    def clear(self):
+        with self.lock, self._connect() as connection:
+            connection.execute("DELETE FROM research")
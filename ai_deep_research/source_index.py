@@ -0,0 +1,178 @@
+"""
+本地研究资料库
+
+把每次深度研究得到的来源 (URL、标题、正文、抓取时间) 和最终分析写入 SQLite FTS5 全文索引,
+按正文内容哈希去重。search_local_sources 工具先在本地资料库中检索, 资料足够时不再发起新的爬取。
+
+中文没有空格分词, 索引使用 trigram 分词器 (SQLite 3.34+), 查询拆成三字片段 OR 匹配并按 BM25 排序;
+不支持 trigram 时退回 unicode61 分词。
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from research_cache import CACHE_DIR
+
+MAX_TEXT_CHARS = 20_000
+
+
+def _source_text(source: Dict[str, Any]) -> str:
+    """来源的正文; Firecrawl 的来源通常只有 description, 有完整内容时优先使用"""
+    for field in ("markdown", "content", "text", "description"):
+        if source.get(field):
+            return str(source[field])[:MAX_TEXT_CHARS]
+    return ""
+
+
+def _snippet(text: str, terms: List[str], width: int = 120) -> str:
+    """正文中第一个检索词附近的片段"""
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in terms if term in lowered]
+    start = max(min(positions) - width // 4, 0) if positions else 0
+    snippet = text[start : start + width].replace("\n", " ")
+    return ("…" if start else "") + snippet + ("…" if start + width < len(text) else "")
+
+
+def content_hash(url: str, text: str) -> str:
+    """正文的哈希, 没有正文时用 URL; 同一内容出现在不同 URL 下只保存一次"""
+    normalized = re.sub(r"\s+", " ", text).strip().lower() or url
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class SourceIndex:
+    """SQLite FTS5 中的来源全文索引"""
+
+    def __init__(self, path: Path = CACHE_DIR / "sources.sqlite3"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sources (
+                    id INTEGER PRIMARY KEY,
+                    content_hash TEXT NOT NULL UNIQUE,
+                    url TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    fetched REAL NOT NULL
+                )
+                """
+            )
+            try:
+                connection.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS sources_fts USING fts5("
+                    "title, text, content='sources', content_rowid='id', tokenize='trigram')"
+                )
+            except sqlite3.OperationalError:
+                connection.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS sources_fts USING fts5("
+                    "title, text, content='sources', content_rowid='id')"
+                )
+            self.trigram = "trigram" in connection.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'sources_fts'"
+            ).fetchone()[0]
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call, so Streamlit threads never share one
+        return sqlite3.connect(self.path, timeout=10)
+
+    def add(self, query: str, sources: List[Dict[str, Any]], final_analysis: str = "") -> int:
+        """
+        保存一次研究的全部来源; 研究的最终分析也作为一条资料保存
+
+        Returns:
+            int: 新增的条数 (重复内容不计)
+        """
+        documents = []
+        for source in sources:
+            url = source.get("url", "")
+            documents.append((url, source.get("title") or url, _source_text(source)))
+        if final_analysis:
+            documents.append((f"research:{query}", f"研究分析：{query}", final_analysis))
+
+        added = 0
+        now = time.time()
+        with self.lock, self._connect() as connection:
+            for url, title, text in documents:
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO sources (content_hash, url, title, text, query, fetched) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (content_hash(url, text), url, title, text, query, now),
+                )
+                if cursor.rowcount:
+                    connection.execute(
+                        "INSERT INTO sources_fts (rowid, title, text) VALUES (?, ?, ?)",
+                        (cursor.lastrowid, title, text),
+                    )
+                    added += 1
+        return added
+
+    def _terms(self, query: str) -> List[str]:
+        """查询中的检索词; trigram 分词下中文按重叠的三字片段拆分, 覆盖每一个字"""
+        terms = []
+        for word in re.findall(r"\w+", query.lower()):
+            if self.trigram and re.search(r"[一-鿿]", word) and len(word) > 3:
+                # CJK runs have no word boundaries; every three-character window is a term
+                terms += [word[i : i + 3] for i in range(len(word) - 2)]
+            else:
+                terms.append(word)
+        return list(dict.fromkeys(terms))
+
+    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        匹配任一检索词的来源, 按 BM25 排序
+
+        trigram 索引无法匹配少于三个字的检索词 (如 "AI"、"5G"), 这些词用子串匹配, 与全文检索的结果合并;
+        每命中一个短词, 排序分数加 1
+        """
+        terms = self._terms(query)
+        if not terms:
+            return []
+        indexed = [term for term in terms if not self.trigram or len(term) >= 3]
+        short = [term for term in terms if term not in indexed]
+
+        if indexed:
+            expression = " OR ".join('"' + term.replace('"', '""') + '"' for term in indexed)
+            matched = (
+                "LEFT JOIN (SELECT rowid, bm25(sources_fts) AS score FROM sources_fts "
+                "WHERE sources_fts MATCH ?) f ON f.rowid = s.id"
+            )
+            parameters = [expression]
+        else:
+            matched = "LEFT JOIN (SELECT NULL AS rowid, NULL AS score) f ON 0"
+            parameters = []
+        like = ["(s.title LIKE ? OR s.text LIKE ?)" for _ in short]
+        like_parameters = [f"%{term}%" for term in short for _ in range(2)]
+        # BM25 scores are negative; each matched short term lowers (improves) the score by one
+        short_hits = " + ".join(like) if like else "0"
+        condition = " OR ".join(["f.rowid IS NOT NULL"] + like)
+        with self._connect() as connection:
+            rows = connection.execute(
+                f"SELECT s.url, s.title, s.text, s.query, s.fetched, "
+                f"COALESCE(f.score, 0) - ({short_hits}) AS score "
+                f"FROM sources s {matched} WHERE {condition} "
+                "ORDER BY score, s.fetched DESC LIMIT ?",
+                (*like_parameters, *parameters, *like_parameters, int(limit)),
+            ).fetchall()
+        return [
+            {
+                "url": url,
+                "title": title,
+                "snippet": _snippet(text, terms),
+                "research_query": research_query,
+                "fetched": time.strftime("%Y-%m-%d", time.localtime(fetched)),
+                "score": round(-score, 3),
+            }
+            for url, title, text, research_query, fetched, score in rows
+        ]
+
+    def count(self) -> int:
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
@@ -1,13 +1,20 @@
 import streamlit as st
 from textwrap import dedent
-from typing import Dict, Any
+from typing import Dict, Any, List
+import asyncio
 import os
+import time
 
 from agno.agent import Agent
 from agno.models.openai import OpenAILike
 from agno.tools import tool
 from firecrawl import FirecrawlApp
 
+from parallel_research import run_parallel_research
+from pipeline import SectionPipeline, iter_content
+from research_cache import MAX_TTL, ResearchCache
+from source_index import SourceIndex
+
 
 # 设置页面配置
 st.set_page_config(
@@ -22,6 +29,38 @@ if 'research_results' not in st.session_state:
     st.session_state.research_results = None
 if 'elaboration_results' not in st.session_state:
     st.session_state.elaboration_results = None
+if 'pipeline_timing' not in st.session_state:
+    st.session_state.pipeline_timing = None
+
+
+@st.cache_resource
+def get_research_cache():
+    """所有会话共享的研究结果缓存"""
+    return ResearchCache()
+
+
+@st.cache_resource
+def get_source_index():
+    """本地研究资料库 (SQLite FTS5)"""
+    return SourceIndex()
+
+
+@tool
+def search_local_sources(query: str, limit: int = 5) -> Dict[str, Any]:
+    """
+    在本地研究资料库中检索之前深度研究抓取过的来源和研究分析，只需几毫秒。
+    应在调用 deep_research 之前先使用；本地资料足够回答问题时不需要再进行网络研究。
+    
+    Args:
+        query: 检索关键词，多个关键词用空格分隔
+        limit: 最多返回的结果数量，默认5
+    
+    Returns:
+        Dict[str, Any]: 匹配的来源列表（URL、标题、相关片段、抓取日期）
+    """
+    results = get_source_index().search(query, limit=limit)
+    st.write(f"📚 本地资料库检索「{query}」：找到 {len(results)} 条相关资料")
+    return {"success": True, "results_count": len(results), "results": results}
 
 
 @tool
@@ -42,6 +81,24 @@ def deep_research(query: str, max_depth: int = 3, time_limit: int = 60, max_urls
         deep_research("人工智能最新发展", max_depth=4, time_limit=120, max_urls=15)
     """
     try:
+        # 相同的查询和参数直接复用缓存的研究结果
+        research_cache = get_research_cache()
+        if st.session_state.get('use_research_cache', True):
+            cached = research_cache.get(
+                query, max_depth, time_limit, max_urls,
+                ttl=st.session_state.get('research_cache_ttl'),
+            )
+            if cached is not None:
+                created = time.strftime("%Y-%m-%d %H:%M", time.localtime(cached['created']))
+                st.info(f"♻️ 命中研究缓存（{created}），跳过网络爬取")
+                return {
+                    "success": True,
+                    "cached": True,
+                    "final_analysis": cached['final_analysis'],
+                    "sources_count": len(cached['sources']),
+                    "sources": cached['sources'][:5]
+                }
+
         if not st.session_state.get('firecrawl_api_key'):
             return {"error": "请先配置 Firecrawl API Key", "success": False}
             
@@ -62,6 +119,14 @@ def deep_research(query: str, max_depth: int = 3, time_limit: int = 60, max_urls
                 on_activity=on_activity
             )
         
+        # 缓存保存完整的来源列表
+        research_cache.put(query, max_depth, time_limit, max_urls, {
+            "final_analysis": results['data']['finalAnalysis'],
+            "sources": results['data']['sources']
+        })
+        # 全部来源写入本地资料库，之后的研究可以先在本地检索
+        get_source_index().add(query, results['data']['sources'], results['data']['finalAnalysis'])
+        
         return {
             "success": True,
             "final_analysis": results['data']['finalAnalysis'],
@@ -73,15 +138,90 @@ def deep_research(query: str, max_depth: int = 3, time_limit: int = 60, max_urls
         return {"error": str(e), "success": False}
 
 
-def create_research_agent(api_key: str):
-    """创建研究智能体"""
+@tool
+def parallel_deep_research(
+    sub_queries: List[str], max_depth: int = 3, time_limit: int = 60, max_urls: int = 10
+) -> Dict[str, Any]:
+    """
+    把宽泛的研究问题拆成几个子问题，同时进行深度网络研究，合并并去重各子问题的来源。
+    总耗时接近最慢的一个子问题，而不是所有子问题之和，适合涉及多个方面的研究主题。
+    
+    Args:
+        sub_queries: 子问题列表（2-5个），每个子问题覆盖原问题的一个方面，彼此尽量不重叠
+        max_depth: 最大爬取深度 (1-5)，默认3
+        time_limit: 所有子问题共享的时间限制（秒），默认60秒
+        max_urls: 所有子问题合计的最大URL数量，默认10
+    
+    Returns:
+        Dict[str, Any]: 各子问题的状态、按子问题分节的分析结果和去重后的来源
+    
+    示例调用：
+        parallel_deep_research(["AI 医学影像诊断进展", "AI 药物研发现状", "医疗 AI 监管政策"], max_depth=3, time_limit=120, max_urls=15)
+    """
+    try:
+        if not st.session_state.get('firecrawl_api_key'):
+            return {"error": "请先配置 Firecrawl API Key", "success": False}
+        
+        st.info(
+            f"🧭 **研究计划**: {len(sub_queries)} 个子问题并行研究，"
+            f"深度={max_depth}, 总时间={time_limit}秒, 总URL数量={max_urls}\n\n"
+            + "\n".join(f"- {query}" for query in sub_queries)
+        )
+        
+        def on_done(result):
+            icon = "✅" if result['status'] in ("ok", "cached") else "⚠️"
+            st.write(f"{icon} 子问题「{result['query']}」：{result['status']}，{len(result['sources'])} 个来源")
+        
+        with st.spinner("正在并行研究各个子问题..."):
+            merged = asyncio.run(run_parallel_research(
+                FirecrawlApp(api_key=st.session_state.firecrawl_api_key),
+                sub_queries,
+                max_depth=max_depth,
+                time_limit=time_limit,
+                max_urls=max_urls,
+                research_cache=get_research_cache(),
+                source_index=get_source_index(),
+                reuse_cached=st.session_state.get('use_research_cache', True),
+                on_done=on_done,
+            ))
+        st.caption(f"⏱️ 并行研究用时 {merged['elapsed']} 秒，合并后 {merged['sources_count']} 个来源")
+        
+        return {
+            "success": merged['success'],
+            "sub_queries": merged['sub_queries'],
+            "final_analysis": merged['final_analysis'],
+            "sources_count": merged['sources_count'],
+            "sources": merged['sources'][:10]  # 限制显示前10个来源
+        }
+    except Exception as e:
+        st.error(f"并行研究错误: {str(e)}")
+        return {"error": str(e), "success": False}
+
+
+def create_research_agent(api_key: str, parallel: bool = False):
+    """创建研究智能体; parallel 为 True 时把问题拆成子问题并行研究"""
+    if parallel:
+        research_tool = parallel_deep_research
+        research_step = dedent("""\
+            2. 本地资料不足时，先把问题拆成 2-5 个互不重叠的子问题，
+               再用 parallel_deep_research 工具一次性并行研究所有子问题
+               - 根据用户要求设置合适的研究参数（max_depth、time_limit、max_urls 为所有子问题的总预算）
+               - 综合各子问题的分析时注意去除重复内容，并指出子问题之间的联系
+        """)
+    else:
+        research_tool = deep_research
+        research_step = dedent("""\
+            2. 本地资料不足时，再使用 deep_research 工具对查询进行全面的网络研究
+               - 根据用户要求设置合适的研究参数（max_depth、time_limit、max_urls）
+               - 如果用户没有明确指定参数，使用工具的默认值
+        """)
     return Agent(
         model=OpenAILike(
             id="qwen-plus-latest",
             api_key=api_key,
             base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
         ),
-        tools=[deep_research],
+        tools=[search_local_sources, research_tool],
         description=dedent("""\
             你是一名专业的AI研究分析师，具有深度网络研究和信息综合的专业能力。
             你的专长在于创建基于事实的、引人入胜的研究报告，结合学术严谨性和叙事吸引力。
@@ -93,14 +233,14 @@ def create_research_agent(api_key: str):
             - 对受过教育的非专业人士来说易于理解\
         """),
         instructions=dedent("""\
-            1. 使用 deep_research 工具对查询进行全面的网络研究
-               - 根据用户要求设置合适的研究参数（max_depth、time_limit、max_urls）
-               - 如果用户没有明确指定参数，使用工具的默认值
-            2. 分析和交叉引用来源的准确性和相关性
-            3. 按照学术标准构建报告，但保持可读性
-            4. 只包括可验证的事实和适当的引用
-            5. 创建引导读者理解复杂主题的引人入胜的叙述
-            6. 以可操作的要点和未来影响作为结尾\
+            1. 先使用 search_local_sources 工具在本地研究资料库中检索相关资料
+               - 本地资料足够全面、新近时，直接基于本地资料撰写报告
+        """) + research_step + dedent("""\
+            3. 分析和交叉引用来源的准确性和相关性
+            4. 按照学术标准构建报告，但保持可读性
+            5. 只包括可验证的事实和适当的引用
+            6. 创建引导读者理解复杂主题的引人入胜的叙述
+            7. 以可操作的要点和未来影响作为结尾\
         """),
         expected_output=dedent("""\
         专业研究报告，Markdown格式：
@@ -142,8 +282,21 @@ def create_research_agent(api_key: str):
     )
 
 
-def create_elaboration_agent(api_key: str):
-    """创建内容阐述智能体"""
+SECTION_EXPECTED_OUTPUT = dedent("""\
+    单个章节的深度阐述，Markdown格式：
+
+    ### {章节标题}
+
+    **核心洞察**：{本节内容的深入分析}
+
+    **多维度分析**：{技术、市场、社会影响等角度中与本节相关的分析}
+
+    **趋势与建议**：{基于本节内容的趋势判断和实用建议}\
+""")
+
+
+def create_elaboration_agent(api_key: str, section: bool = False):
+    """创建内容阐述智能体; section=True 时只阐述报告中的一个章节, 供流水线模式并行调用"""
     return Agent(
         model=OpenAILike(
             id="qwen-plus-latest",
@@ -169,7 +322,7 @@ def create_elaboration_agent(api_key: str):
             5. 确保内容的逻辑性和连贯性
             6. 增强可读性和实用性\
         """),
-        expected_output=dedent("""\
+        expected_output=SECTION_EXPECTED_OUTPUT if section else dedent("""\
         深度阐述报告，Markdown格式：
 
         # 深度阐述分析
@@ -205,6 +358,67 @@ def create_elaboration_agent(api_key: str):
     )
 
 
+def run_pipeline(research_agent, research_prompt: str, research_query: str, api_key: str):
+    """
+    流水线模式: 研究报告逐字流式显示, 每写完一节就在后台开始阐述这一节
+
+    结果写入 research_results、elaboration_results 和 pipeline_timing
+    """
+    started = time.perf_counter()
+    elaboration_seconds: List[float] = []
+
+    def elaborate(section: str) -> str:
+        # Runs in a worker thread: no Streamlit calls or session_state access here
+        section_started = time.perf_counter()
+        response = create_elaboration_agent(api_key, section=True).run(dedent(f"""\
+            以下是关于“{research_query}”的研究报告中的一个章节，请只对这一章节进行深度阐述：
+
+            {section}
+        """))
+        elaboration_seconds.append(time.perf_counter() - section_started)
+        return response.content
+
+    pipeline = SectionPipeline(elaborate)
+    timing_box = st.empty()
+    report_box = st.empty()
+    first_token = None
+    report = ""
+
+    for delta in iter_content(research_agent.run(research_prompt, stream=True)):
+        if first_token is None:
+            first_token = time.perf_counter() - started
+        report += delta
+        report_box.markdown(report + "▌")
+        pipeline.feed(report)
+        timing_box.caption(
+            f"⏱️ 首字延迟 {first_token:.1f} 秒 · 已写 {len(report)} 字 · "
+            f"阐述 {pipeline.done}/{len(pipeline.sections)} 节"
+        )
+    report_box.markdown(report)
+    research_done = time.perf_counter() - started
+    pipeline.finish(report)
+    st.session_state.research_results = report
+
+    elaborations = ["# 深度阐述分析"]
+    for title, future in pipeline.sections:
+        with st.spinner(f"正在阐述：{title}"):
+            try:
+                elaborations.append(future.result())
+            except Exception as e:
+                elaborations.append(f"### {title}\n\n> 阐述失败: {str(e)}")
+    st.session_state.elaboration_results = "\n\n".join(elaborations)
+
+    st.session_state.pipeline_timing = {
+        "first_token": first_token,
+        "research": research_done,
+        "total": time.perf_counter() - started,
+        "sections": len(pipeline.sections),
+        "elaboration_sum": sum(elaboration_seconds),
+    }
+    timing_box.empty()
+    report_box.empty()
+
+
 def main():
     st.title("🔬 AI 深度研究助手")
     st.markdown("基于 Qwen API 和 Agno 框架的智能研究分析平台")
@@ -244,6 +458,35 @@ def main():
         - URL：{max_urls} 个
         """)
         
+        st.session_state.parallel_research = st.checkbox(
+            "拆分子问题并行研究", value=False,
+            help="把宽泛的问题拆成几个子问题同时爬取，深度、时间和 URL 数量作为所有子问题的总预算"
+        )
+        
+        st.session_state.pipeline_mode = st.checkbox(
+            "流水线模式（流式输出并同时阐述）", value=False,
+            help="研究报告逐字显示，每写完一节就立即开始阐述这一节，不必等完整报告后再点击'深度阐述'"
+        )
+        
+        # 研究缓存
+        st.subheader("研究缓存")
+        st.session_state.use_research_cache = st.checkbox(
+            "复用缓存的研究结果", value=True,
+            help="相同的问题和参数直接返回之前的研究结果；取消勾选时重新爬取并更新缓存"
+        )
+        st.session_state.research_cache_ttl = st.number_input(
+            "缓存有效期（小时）", min_value=1, max_value=MAX_TTL // 3600, value=24 * 7
+        ) * 3600
+        cache_info = get_research_cache().info()
+        st.caption(
+            f"{cache_info['entries']} 条结果，{cache_info['bytes'] / 1024 / 1024:.1f} MB；"
+            f"本次运行命中 {cache_info['hits']} / 未命中 {cache_info['misses']}"
+        )
+        if st.button("清空研究缓存"):
+            get_research_cache().clear()
+            st.success("研究缓存已清空")
+        st.caption(f"📚 本地资料库：{get_source_index().count()} 条资料")
+        
         # 保存配置到 session state
         if qwen_api_key:
             st.session_state.qwen_api_key = qwen_api_key
@@ -265,6 +508,8 @@ def main():
         
         # 按钮组
         col_btn1, col_btn2, col_btn3 = st.columns(3)
+        # Pipeline mode streams into the full width below the buttons
+        live_area = st.container()
         
         with col_btn1:
             if st.button("🔍 开始研究", type="primary", use_container_width=True):
@@ -278,9 +523,11 @@ def main():
                     # 执行研究
                     with st.spinner("正在进行深度研究..."):
                         try:
+                            parallel = st.session_state.get('parallel_research', False)
                             research_agent = create_research_agent(
-                                st.session_state.qwen_api_key
+                                st.session_state.qwen_api_key, parallel=parallel
                             )
+                            tool_name = "parallel_deep_research" if parallel else "deep_research"
                             
                             # 构建包含参数的研究查询
                             research_prompt = f"""
@@ -293,16 +540,26 @@ def main():
                             - 时间限制: {time_limit} 秒
                             - 最大URL数量: {max_urls}
 
-                            请调用 deep_research 工具时使用上述参数。
+                            请调用 {tool_name} 工具时使用上述参数。
                             """
                             
                             # 显示当前使用的参数
                             st.info(f"📊 **研究参数**: 深度={max_depth}, 时间={time_limit}秒, URL数量={max_urls}")
                             
                             # 运行研究
-                            response = research_agent.run(research_prompt)
-                            st.session_state.research_results = response.content
-                            st.success("研究完成！")
+                            if st.session_state.get('pipeline_mode', False):
+                                with live_area:
+                                    run_pipeline(
+                                        research_agent, research_prompt, research_query,
+                                        st.session_state.qwen_api_key,
+                                    )
+                                st.success("研究和深度阐述完成！")
+                            else:
+                                response = research_agent.run(research_prompt)
+                                st.session_state.research_results = response.content
+                                st.session_state.elaboration_results = None
+                                st.session_state.pipeline_timing = None
+                                st.success("研究完成！")
                             
                         except Exception as e:
                             st.error(f"研究过程中发生错误: {str(e)}")
@@ -338,6 +595,7 @@ def main():
             if st.button("🗑️ 清除结果", use_container_width=True):
                 st.session_state.research_results = None
                 st.session_state.elaboration_results = None
+                st.session_state.pipeline_timing = None
                 st.success("结果已清除")
     
     with col2:
@@ -373,6 +631,14 @@ def main():
     if st.session_state.get('research_results'):
         st.header("📊 研究结果")
         
+        timing = st.session_state.get('pipeline_timing')
+        if timing:
+            st.caption(
+                f"⏱️ 首字延迟 {timing['first_token'] or 0:.1f} 秒 · 研究报告 {timing['research']:.1f} 秒 · "
+                f"研究 + 阐述总耗时 {timing['total']:.1f} 秒（{timing['sections']} 节阐述串行合计 "
+                f"{timing['elaboration_sum']:.1f} 秒）"
+            )
+        
         # 创建选项卡
         tab1, tab2 = st.tabs(["基础研究", "深度阐述"])
         
@@ -62,10 +62,49 @@ def get_model_for_provider(provider: str, model_name: str):
         raise ValueError(f"Unsupported model provider: {provider}")
 
 
+# 紧凑编码模式下两位玩家共享的静态规则。它是系统提示的开头且每次调用都逐字节相同，
+# 便于模型提供方做前缀缓存；玩家身份放在其后的 instructions 中。
+COMPACT_RULES = dedent("""\
+    井字棋。棋盘按行编码为 9 个字符, 下标 0-8:
+    0 1 2
+    3 4 5
+    6 7 8
+    X/O 为已落子, . 为空。X 先手, 双方轮流落子。
+    先在一行(横、竖或斜)连成三子者获胜; 下满仍无人获胜则为平局。
+    每回合你会收到 "棋盘: <9个字符>" 和 "有效: <下标列表>"。
+    只回复 JSON: {"move": 下标}, 下标必须来自有效列表。
+    策略: 能赢就赢, 否则阻止对手连成三子, 再争夺中心和角。\
+""")
+
+
+def get_compact_player(model, symbol: str, debug_mode: bool = False) -> Agent:
+    """
+    返回一个使用紧凑编码的玩家代理。
+
+    Args:
+        model: 模型实例, 或 `provider:model` 字符串
+        symbol: 玩家标记, "X" 或 "O"
+        debug_mode: 启用日志和调试功能
+
+    Returns:
+        一个以 COMPACT_RULES 作为系统提示开头的玩家代理
+    """
+    if isinstance(model, str):
+        model = get_model_for_provider(*model.split(":"))
+    return Agent(
+        name=f"Player {symbol}",
+        description=COMPACT_RULES,
+        instructions=[f"你执 {symbol}。"],
+        model=model,
+        debug_mode=debug_mode,
+    )
+
+
 def get_tic_tac_toe_players(
     model_x: str = "deepseek:deepseek-chat",
     model_o: str = "qwen:qwen-plus-latest",
     debug_mode: bool = True,
+    encoding: str = "ascii",
 ) -> Tuple[Agent, Agent]:
     """
     返回一个井字棋裁判代理实例，负责协调游戏。
@@ -74,6 +113,7 @@ def get_tic_tac_toe_players(
         model_x: 模型配置为玩家 X
         model_o: 模型配置为玩家 O
         debug_mode: 启用日志和调试功能
+        encoding: 棋盘编码, "ascii" 或 "compact" (9 字符棋盘 + 下标, 规则放在共享的静态系统提示中)
 
     Returns:
         一个配置好的裁判代理实例
@@ -86,6 +126,12 @@ def get_tic_tac_toe_players(
     model_x = get_model_for_provider(provider_x, model_name_x)
     model_o = get_model_for_provider(provider_o, model_name_o)
 
+    if encoding == "compact":
+        return (
+            get_compact_player(model_x, "X", debug_mode),
+            get_compact_player(model_o, "O", debug_mode),
+        )
+
     player_x = Agent(
         name="Player X",
         description=dedent("""\
@@ -102,8 +148,8 @@ def get_tic_tac_toe_players(
         - 如果所有空格都填满但没有获胜者,则游戏平局
 
         你的回应:
-        - 只需提供两个由空格分隔的数字(行 列)
-        - 示例: "1 2" 表示在第1行第2列放置 X
+        - 只回复一个 JSON 对象: {"row": 行, "col": 列}
+        - 示例: {"row": 1, "col": 2} 表示在第1行第2列放置 X
         - 只能从提供给你的有效移动列表中选择
 
         策略提示:
@@ -132,8 +178,8 @@ def get_tic_tac_toe_players(
         - 如果所有空格都填满但没有获胜者,则游戏平局
 
         你的回应:
-        - 只需提供两个由空格分隔的数字(行 列)
-        - 示例: "1 2" 表示在第1行第2列放置 O
+        - 只回复一个 JSON 对象: {"row": 行, "col": 列}
+        - 示例: {"row": 1, "col": 2} 表示在第1行第2列放置 O
         - 只能从提供给你的有效移动列表中选择
 
         策略提示:
@@ -1,13 +1,17 @@
 import os
+
 import nest_asyncio
 import streamlit as st
 from agent import get_tic_tac_toe_players
 from agno.utils.log import logger
+from referee import new_move_stats, resolve_move
+from solver import classify_move
 from utils import (
     CUSTOM_CSS,
     TicTacToeBoard,
     display_board,
     display_move_history,
+    get_move_prompt,
     show_agent_status,
 )
 
@@ -41,6 +45,10 @@ def main():
         st.session_state.game_started = False
         st.session_state.game_paused = False
         st.session_state.move_history = []
+    if "move_stats" not in st.session_state:
+        st.session_state.move_stats = new_move_stats()
+    if "prompt_encoding" not in st.session_state:
+        st.session_state.prompt_encoding = "compact"
 
     with st.sidebar:
         st.markdown("### 游戏控制")
@@ -63,6 +71,13 @@ def main():
             index=list(model_options.keys()).index("qwen-plus-latest"),
             key="model_p2",
         )
+        encoding_options = {"紧凑 (9 字符 + 下标)": "compact", "ASCII 棋盘": "ascii"}
+        selected_encoding = st.selectbox(
+            "棋盘编码",
+            list(encoding_options.keys()),
+            key="prompt_encoding_label",
+            help="紧凑编码把规则放在可缓存的静态系统提示中，每回合只发送棋盘和有效下标",
+        )
 
         # API Key 输入
         deepseek_api_key = st.text_input(
@@ -95,8 +110,10 @@ def main():
                             model_x=model_options[selected_p_x],
                             model_o=model_options[selected_p_o],
                             debug_mode=True,
+                            encoding=encoding_options[selected_encoding],
                         )
                     )
+                    st.session_state.prompt_encoding = encoding_options[selected_encoding]
                     st.session_state.game_board = TicTacToeBoard()
                     st.session_state.game_started = True
                     st.session_state.game_paused = False
@@ -118,8 +135,10 @@ def main():
                             model_x=model_options[selected_p_x],
                             model_o=model_options[selected_p_o],
                             debug_mode=True,
+                            encoding=encoding_options[selected_encoding],
                         )
                     )
+                    st.session_state.prompt_encoding = encoding_options[selected_encoding]
                     st.session_state.game_board = TicTacToeBoard()
                     st.session_state.game_paused = False
                     st.session_state.move_history = []
@@ -178,27 +197,33 @@ def main():
                 unsafe_allow_html=True,
             )
 
-            valid_moves = st.session_state.game_board.get_valid_moves()
-
             current_agent = (
                 st.session_state.player_x
                 if current_player == "X"
                 else st.session_state.player_o
             )
             response = current_agent.run(
-                f"""\
-当前棋盘状态:\n{st.session_state.game_board.get_board_state()}\n
-有效移动 (行, 列): {valid_moves}\n
-选择你下一步的移动，从上面的有效移动中选择。
-只用两个数字表示行和列，例如 "1 2"。""",
+                get_move_prompt(
+                    st.session_state.game_board, st.session_state.prompt_encoding
+                ),
                 stream=False,
             )
 
             try:
-                import re
-
-                numbers = re.findall(r"\d+", response.content if response else "")
-                row, col = map(int, numbers[:2])
+                move, source, tokens = resolve_move(
+                    current_agent,
+                    st.session_state.game_board,
+                    response,
+                    st.session_state.move_stats,
+                    st.session_state.prompt_encoding,
+                )
+                fallback = source == "solver"
+                if source != "agent":
+                    logger.error(
+                        f"无效移动尝试: {response.content if response else None}, 由 {source} 解决"
+                    )
+                row, col = move
+                quality = classify_move(st.session_state.game_board, row, col)
                 success, message = st.session_state.game_board.make_move(row, col)
 
                 if success:
@@ -208,11 +233,15 @@ def main():
                             "number": move_number,
                             "player": f"Player {player_num} ({current_model_name})",
                             "move": f"{row},{col}",
+                            "quality": quality,
+                            "fallback": fallback,
+                            "tokens": tokens,
                         }
                     )
 
                     logger.info(
-                        f"移动 {move_number}: 玩家 {player_num} ({current_model_name}) 在位置 ({row}, {col})"
+                        f"移动 {move_number}: 玩家 {player_num} ({current_model_name}) 在位置 ({row}, {col}) [{quality}], "
+                        f"tokens: 输入 {tokens['input_tokens']} / 输出 {tokens['output_tokens']} / 缓存 {tokens['cached_tokens']}"
                     )
                     logger.info(
                         f"棋盘状态:\n{st.session_state.game_board.get_board_state()}"
@@ -230,16 +259,6 @@ def main():
                     st.rerun()
                 else:
                     logger.error(f"无效移动尝试: {message}")
-                    response = current_agent.run(
-                        f"""\
-无效移动: {message}
-
-当前棋盘状态:\n{st.session_state.game_board.get_board_state()}\n
-有效移动 (行, 列): {valid_moves}\n
-请从上面的有效移动列表中选择一个有效的移动。
-只用两个数字表示行和列，例如 "1 2"。""",
-                        stream=False,
-                    )
                     st.rerun()
 
             except Exception as e:
@@ -249,6 +268,20 @@ def main():
     else:
         st.info("👈 点击 '开始游戏' 开始游戏!")
 
+    ####################################################################
+    # Move resolution counters
+    ####################################################################
+    stats = st.session_state.move_stats
+    st.sidebar.markdown(
+        f"""
+    ### 📊 移动解析统计
+    * 移动: {stats["moves"]}
+    * 重试: {stats["retries"]} (成功 {stats["retry_successes"]})
+    * 求解器兜底: {stats["solver_fallbacks"]}
+    * 浪费的 Token: {stats["wasted_tokens"]} / {stats["tokens"]}
+    """
+    )
+
     ####################################################################
     # About section
     ####################################################################
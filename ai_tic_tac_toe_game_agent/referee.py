@@ -0,0 +1,97 @@
+"""
+Move resolution for agent replies.
+
+A reply is parsed and checked against the legal moves. If it is not a legal move the
+agent gets exactly one compact retry prompt; if that also fails the move is resolved
+locally by the solver, so a turn never costs more than two model round trips.
+"""
+
+from typing import Dict, Optional, Tuple
+
+from solver import best_move
+from utils import TicTacToeBoard, encode_board, get_move_prompt, parse_move
+
+
+def new_move_stats() -> Dict[str, int]:
+    """Counters updated by resolve_move, kept per session or per game."""
+    return {
+        "moves": 0,
+        "retries": 0,
+        "retry_successes": 0,
+        "solver_fallbacks": 0,
+        "tokens": 0,
+        "wasted_tokens": 0,
+    }
+
+
+def response_token_usage(response) -> Dict[str, int]:
+    """
+    Token usage of an agent run, as reported in its metrics.
+
+    Returns:
+        Dict[str, int]: input, output, cached and total token counts (0 when not reported)
+    """
+    metrics = getattr(response, "metrics", None) or {}
+    usage = {}
+    for key in ("input_tokens", "output_tokens", "cached_tokens", "total_tokens"):
+        value = metrics.get(key, 0)
+        usage[key] = sum(value) if isinstance(value, list) else int(value or 0)
+    return usage
+
+
+def get_retry_prompt(board: TicTacToeBoard, reply: Optional[str], encoding: str = "ascii") -> str:
+    """
+    Build the compact retry prompt: the rejected reply, the board as 9 cells and the legal moves.
+    """
+    rejected = f"无效移动: {(reply or '').strip()[:40]!r}\n"
+    if encoding == "compact":
+        return rejected + get_move_prompt(board, encoding)
+    return (
+        rejected
+        + f"棋盘(按行, .为空): {encode_board(board)}\n"
+        + f"有效移动 (行, 列): {board.get_valid_moves()}\n"
+        + '只回复 JSON, 例如 {"row": 1, "col": 2}。'
+    )
+
+
+def resolve_move(
+    agent, board: TicTacToeBoard, response, stats: Dict[str, int], encoding: str = "ascii"
+) -> Tuple[Tuple[int, int], str, Dict[str, int]]:
+    """
+    Turn an agent's reply into a legal move.
+
+    Args:
+        agent: The agent that produced the reply, used for the single retry
+        board (TicTacToeBoard): Position the move is for
+        response: The agent's run response
+        stats (Dict[str, int]): Counters from new_move_stats(), updated in place
+        encoding (str): Board encoding used for the retry prompt, "ascii" or "compact"
+
+    Returns:
+        Tuple[Tuple[int, int], str, Dict[str, int]]: ((row, col), source, token usage of the move)
+        where source is "agent", "retry" or "solver"
+    """
+    valid_moves = board.get_valid_moves()
+    stats["moves"] += 1
+
+    reply = response.content if response else None
+    usage = response_token_usage(response)
+    stats["tokens"] += usage["total_tokens"]
+    move = parse_move(reply)
+    if move in valid_moves:
+        return move, "agent", usage
+    stats["wasted_tokens"] += usage["total_tokens"]
+
+    stats["retries"] += 1
+    retry = agent.run(get_retry_prompt(board, reply, encoding), stream=False)
+    retry_usage = response_token_usage(retry)
+    usage = {key: usage[key] + retry_usage[key] for key in usage}
+    stats["tokens"] += retry_usage["total_tokens"]
+    move = parse_move(retry.content if retry else None)
+    if move in valid_moves:
+        stats["retry_successes"] += 1
+        return move, "retry", usage
+    stats["wasted_tokens"] += retry_usage["total_tokens"]
+
+    stats["solver_fallbacks"] += 1
+    return best_move(board), "solver", usage
@@ -0,0 +1,276 @@
+"""
+井字棋自对弈数据生成
+---------------------------------
+生成大量局面并记录模型在每个局面下的选择，用于模型升级时的离线回归评估。
+
+- 局面模拟和求解器标注在进程池中进行 (随机对局, 按比例混入最优走法)
+- 模型调用在 asyncio 中并发进行, 并发数由信号量限制
+- 结果按批次流式写入 Parquet, 内存占用与总行数无关
+
+使用示例:
+---------------
+python selfplay.py --games 100000 --model deepseek:deepseek-chat --model qwen:qwen-plus-latest \\
+    --output positions.parquet
+
+不传 --model 时只输出带求解器标注的局面。
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from agent import get_compact_player
+from agno.utils.log import logger
+from referee import response_token_usage
+from solver import best_move, best_moves, canonical, position_value
+from utils import O_PLAYER, X_PLAYER, TicTacToeBoard, encode_board, get_move_prompt, parse_move
+
+SCHEMA = pa.schema(
+    [
+        ("position_hash", pa.int32()),
+        ("board", pa.string()),
+        ("side_to_move", pa.string()),
+        ("ply", pa.int8()),
+        ("value", pa.int8()),
+        ("optimal_moves", pa.list_(pa.int8())),
+        ("model", pa.string()),
+        ("reply", pa.string()),
+        ("chosen_move", pa.int8()),
+        ("is_legal", pa.bool_()),
+        ("is_optimal", pa.bool_()),
+        ("latency_s", pa.float32()),
+        ("input_tokens", pa.int32()),
+        ("output_tokens", pa.int32()),
+    ]
+)
+
+# (x_bits, o_bits, position_hash, value, optimal cell indices)
+Position = Tuple[int, int, int, int, List[int]]
+
+
+def position_hash(board: TicTacToeBoard) -> int:
+    """
+    Symmetry-invariant 18-bit id of a position: canonical side-to-move bits, then opponent bits.
+    """
+    me = board.bits[board.current_player]
+    opp = board.bits[O_PLAYER if board.current_player == X_PLAYER else X_PLAYER]
+    me, opp = canonical(me, opp)
+    return me << 9 | opp
+
+
+def simulate_positions(seed: int, games: int, optimal_rate: float) -> List[Position]:
+    """
+    Play random games and label every non-terminal position with the solver.
+
+    Runs in a worker process.
+
+    Args:
+        seed: Random seed for this chunk
+        games: Number of games to simulate
+        optimal_rate: Probability of playing a solver move instead of a random legal move
+
+    Returns:
+        List[Position]: Every position where a move was to be made
+    """
+    rng = random.Random(seed)
+    positions: List[Position] = []
+    for _ in range(games):
+        board = TicTacToeBoard()
+        while not board.get_game_state()[0]:
+            optimal = best_moves(board)
+            positions.append(
+                (
+                    board.bits[X_PLAYER],
+                    board.bits[O_PLAYER],
+                    position_hash(board),
+                    position_value(board),
+                    [row * 3 + col for row, col in optimal],
+                )
+            )
+            if rng.random() < optimal_rate:
+                move = best_move(board)
+            else:
+                move = rng.choice(board.get_valid_moves())
+            board.make_move(*move)
+    return positions
+
+
+async def _ask_model(model: str, position: Position, semaphore: asyncio.Semaphore) -> Dict:
+    """Ask one model for its move in a position and grade the reply."""
+    x_bits, o_bits, _, _, optimal = position
+    board = TicTacToeBoard.from_bits(x_bits, o_bits)
+    async with semaphore:
+        # A fresh agent per call: agno agents keep per-run state and are not safe to share
+        agent = get_compact_player(model, board.current_player)
+        started = time.perf_counter()
+        try:
+            response = await agent.arun(get_move_prompt(board, "compact"), stream=False)
+        except Exception as e:
+            logger.error(f"{model} 调用失败: {e}")
+            response = None
+        latency = time.perf_counter() - started
+
+    reply = response.content if response else None
+    move = parse_move(reply)
+    is_legal = move in board.get_valid_moves()
+    chosen = move[0] * 3 + move[1] if is_legal else -1
+    usage = response_token_usage(response)
+    return {
+        "model": model,
+        "reply": reply,
+        "chosen_move": chosen,
+        "is_legal": is_legal,
+        "is_optimal": chosen in optimal,
+        "latency_s": latency,
+        "input_tokens": usage["input_tokens"],
+        "output_tokens": usage["output_tokens"],
+    }
+
+
+def _position_row(position: Position) -> Dict:
+    x_bits, o_bits, key, value, optimal = position
+    board = TicTacToeBoard.from_bits(x_bits, o_bits)
+    return {
+        "position_hash": key,
+        "board": encode_board(board),
+        "side_to_move": board.current_player,
+        "ply": bin(x_bits | o_bits).count("1"),
+        "value": value,
+        "optimal_moves": optimal,
+    }
+
+
+async def _label_positions(
+    positions: List[Position], models: List[str], semaphore: asyncio.Semaphore
+) -> List[Dict]:
+    """Build output rows for a chunk: one per position and model, or one per position if no models."""
+    if not models:
+        return [_position_row(position) for position in positions]
+
+    tasks = [
+        _ask_model(model, position, semaphore) for position in positions for model in models
+    ]
+    answers = await asyncio.gather(*tasks)
+    rows = []
+    for i, answer in enumerate(answers):
+        row = _position_row(positions[i // len(models)])
+        row.update(answer)
+        rows.append(row)
+    return rows
+
+
+async def generate_dataset(
+    output: Path,
+    games: int,
+    models: Optional[List[str]] = None,
+    games_per_chunk: int = 500,
+    workers: int = 4,
+    concurrency: int = 16,
+    batch_size: int = 50_000,
+    optimal_rate: float = 0.5,
+    seed: int = 0,
+) -> int:
+    """
+    Simulate games, query models on every position and stream the rows to a Parquet file.
+
+    Args:
+        output: Parquet file to write
+        games: Number of games to simulate
+        models: `provider:model` specs to query on every position (none: solver labels only)
+        games_per_chunk: Games simulated per process-pool task
+        workers: Number of simulation processes
+        concurrency: Max concurrent model calls
+        batch_size: Rows buffered before a row group is written
+        optimal_rate: Probability of playing a solver move during simulation
+        seed: Base random seed; chunk i uses seed + i
+
+    Returns:
+        int: Number of rows written
+    """
+    models = models or []
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    chunk_sizes = [games_per_chunk] * (games // games_per_chunk)
+    if games % games_per_chunk:
+        chunk_sizes.append(games % games_per_chunk)
+
+    written = 0
+    buffer: List[Dict] = []
+    with ProcessPoolExecutor(max_workers=workers) as pool, pq.ParquetWriter(
+        output, SCHEMA
+    ) as writer:
+        # Keep a bounded window of simulation chunks in flight while the model calls run
+        pending: deque = deque()
+        chunks = iter(enumerate(chunk_sizes))
+        for _ in range(workers * 2):
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending.append(
+                    loop.run_in_executor(
+                        pool, simulate_positions, seed + chunk[0], chunk[1], optimal_rate
+                    )
+                )
+
+        while pending:
+            positions = await pending.popleft()
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending.append(
+                    loop.run_in_executor(
+                        pool, simulate_positions, seed + chunk[0], chunk[1], optimal_rate
+                    )
+                )
+
+            buffer.extend(await _label_positions(positions, models, semaphore))
+            if len(buffer) >= batch_size:
+                writer.write_table(pa.Table.from_pylist(buffer, schema=SCHEMA))
+                written += len(buffer)
+                logger.info(f"已写入 {written} 行")
+                buffer = []
+
+        if buffer:
+            writer.write_table(pa.Table.from_pylist(buffer, schema=SCHEMA))
+            written += len(buffer)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="井字棋自对弈数据生成")
+    parser.add_argument("--games", type=int, default=1000, help="模拟对局数")
+    parser.add_argument(
+        "--model", action="append", default=[], help="要评估的模型, 例如 deepseek:deepseek-chat"
+    )
+    parser.add_argument("--output", type=Path, default=Path("positions.parquet"), help="Parquet 输出文件")
+    parser.add_argument("--workers", type=int, default=4, help="模拟进程数")
+    parser.add_argument("--concurrency", type=int, default=16, help="最大并发模型调用数")
+    parser.add_argument("--chunk", type=int, default=500, help="每个进程任务模拟的对局数")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="每个写入批次的行数")
+    parser.add_argument("--optimal-rate", type=float, default=0.5, help="模拟时选择最优走法的概率")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    rows = asyncio.run(
+        generate_dataset(
+            args.output,
+            args.games,
+            models=args.model,
+            games_per_chunk=args.chunk,
+            workers=args.workers,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            optimal_rate=args.optimal_rate,
+            seed=args.seed,
+        )
+    )
+    print(f"共写入 {rows} 行到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Perfect-play solver for TicTacToeBoard positions.
+
+Positions are searched with negamax and alpha-beta pruning. Every position is
+reduced to its canonical form under the 8 symmetries of the board before it is
+looked up, so the whole game fits in a few hundred table entries. The exact
+value table is built lazily on first use and persisted next to this module.
+"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils import FULL_MASK, WINNING_BITS, X_PLAYER, O_PLAYER, TicTacToeBoard
+
+TABLE_PATH = Path(__file__).with_name("solver_table.json")
+
+WIN, DRAW, LOSS = 1, 0, -1
+
+# Center first, then corners, then edges: strongest moves first means earlier cutoffs
+MOVE_ORDER = (4, 0, 2, 6, 8, 1, 3, 5, 7)
+
+# Transposition table bound flags
+_EXACT, _LOWER, _UPPER = 0, 1, 2
+
+
+def _build_symmetries() -> List[Tuple[int, ...]]:
+    """Return the 8 board symmetries as cell permutations (new index -> old index)."""
+    rotate = tuple((2 - col) * 3 + row for row in range(3) for col in range(3))
+    mirror = tuple(row * 3 + (2 - col) for row in range(3) for col in range(3))
+    perms = []
+    perm = tuple(range(9))
+    for _ in range(4):
+        perms.append(perm)
+        perms.append(tuple(perm[i] for i in mirror))
+        perm = tuple(perm[i] for i in rotate)
+    return perms
+
+
+SYMMETRIES = _build_symmetries()
+
+# _PERMUTED[s][bits] is the 9-bit mask `bits` transformed by symmetry s
+_PERMUTED = [
+    [
+        sum(1 << new for new, old in enumerate(perm) if bits >> old & 1)
+        for bits in range(FULL_MASK + 1)
+    ]
+    for perm in SYMMETRIES
+]
+
+_values: Optional[Dict[Tuple[int, int], int]] = None
+_search_table: Dict[Tuple[int, int], Tuple[int, int]] = {}
+
+
+def canonical(me: int, opp: int) -> Tuple[int, int]:
+    """
+    Canonical key of a position under the 8 board symmetries.
+
+    Args:
+        me (int): Bitboard of the side to move
+        opp (int): Bitboard of the opponent
+
+    Returns:
+        Tuple[int, int]: The smallest (me, opp) pair over all symmetries
+    """
+    return min((table[me], table[opp]) for table in _PERMUTED)
+
+
+def _negamax(me: int, opp: int, alpha: int, beta: int) -> int:
+    """Negamax with alpha-beta pruning over a symmetry-aware transposition table."""
+    if opp in WINNING_BITS:
+        return LOSS
+    occupied = me | opp
+    if occupied == FULL_MASK:
+        return DRAW
+
+    key = canonical(me, opp)
+    entry = _search_table.get(key)
+    if entry is not None:
+        value, flag = entry
+        if flag == _EXACT:
+            return value
+        if flag == _LOWER:
+            alpha = max(alpha, value)
+        else:
+            beta = min(beta, value)
+        if alpha >= beta:
+            return value
+
+    alpha_orig = alpha
+    best = LOSS - 1
+    for cell in MOVE_ORDER:
+        bit = 1 << cell
+        if occupied & bit:
+            continue
+        value = -_negamax(opp, me | bit, -beta, -alpha)
+        if value > best:
+            best = value
+        if best > alpha:
+            alpha = best
+        if alpha >= beta:
+            break
+
+    if best <= alpha_orig:
+        flag = _UPPER
+    elif best >= beta:
+        flag = _LOWER
+    else:
+        flag = _EXACT
+    _search_table[key] = (best, flag)
+    return best
+
+
+def _solve_exact(me: int, opp: int) -> int:
+    """Exact value of a position; a full window at the root never returns a bound."""
+    return _negamax(me, opp, LOSS, WIN)
+
+
+def build_table() -> Dict[Tuple[int, int], int]:
+    """
+    Solve every reachable non-terminal position.
+
+    Returns:
+        Dict[Tuple[int, int], int]: Exact value for the side to move, keyed by canonical position
+    """
+    values: Dict[Tuple[int, int], int] = {}
+    stack = [(0, 0)]
+    while stack:
+        me, opp = stack.pop()
+        key = canonical(me, opp)
+        if key in values or opp in WINNING_BITS or me | opp == FULL_MASK:
+            continue
+        values[key] = _solve_exact(me, opp)
+        for cell in range(9):
+            bit = 1 << cell
+            if not (me | opp) & bit:
+                stack.append((opp, me | bit))
+    return values
+
+
+def load_table(path: Path = TABLE_PATH) -> Dict[Tuple[int, int], int]:
+    """
+    Load the value table from disk, building and saving it if it is missing or unreadable.
+
+    Args:
+        path (Path): Location of the persisted JSON table
+
+    Returns:
+        Dict[Tuple[int, int], int]: Exact value for the side to move, keyed by canonical position
+    """
+    global _values
+    if _values is not None:
+        return _values
+
+    try:
+        raw = json.loads(path.read_text())
+        _values = {tuple(map(int, key.split(","))): value for key, value in raw.items()}
+    except (OSError, ValueError):
+        _values = build_table()
+        # Write to a temporary file and rename it, so concurrent workers never read a partial table
+        try:
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump({f"{me},{opp}": value for (me, opp), value in _values.items()}, f)
+                os.replace(tmp, path)
+            except OSError:
+                os.unlink(tmp)
+                raise
+        except OSError:
+            pass
+    return _values
+
+
+def _split(board: TicTacToeBoard) -> Tuple[int, int]:
+    """Return (side to move, opponent) bitboards."""
+    if board.current_player == X_PLAYER:
+        return board.bits[X_PLAYER], board.bits[O_PLAYER]
+    return board.bits[O_PLAYER], board.bits[X_PLAYER]
+
+
+def _value(me: int, opp: int) -> int:
+    """Value for the side to move, including terminal positions."""
+    if opp in WINNING_BITS:
+        return LOSS
+    if me | opp == FULL_MASK:
+        return DRAW
+    values = load_table()
+    key = canonical(me, opp)
+    if key not in values:
+        values[key] = _solve_exact(me, opp)
+    return values[key]
+
+
+def position_value(board: TicTacToeBoard) -> int:
+    """
+    Game-theoretic value of the position for the player to move.
+
+    Args:
+        board (TicTacToeBoard): Position to evaluate
+
+    Returns:
+        int: 1 (win), 0 (draw) or -1 (loss) with perfect play from both sides
+    """
+    return _value(*_split(board))
+
+
+def move_values(board: TicTacToeBoard) -> Dict[Tuple[int, int], int]:
+    """
+    Value of every legal move for the player to move.
+
+    Returns:
+        Dict[Tuple[int, int], int]: (row, col) -> 1 (win), 0 (draw) or -1 (loss)
+    """
+    me, opp = _split(board)
+    return {
+        (row, col): -_value(opp, me | 1 << (row * 3 + col))
+        for row, col in board.get_valid_moves()
+    }
+
+
+def best_moves(board: TicTacToeBoard) -> List[Tuple[int, int]]:
+    """
+    All moves that preserve the game-theoretic value of the position.
+
+    Returns:
+        List[Tuple[int, int]]: Optimal (row, col) moves, empty if the game is over
+    """
+    if board.get_game_state()[0]:
+        return []
+    values = move_values(board)
+    best = max(values.values())
+    return [move for move, value in values.items() if value == best]
+
+
+def best_move(board: TicTacToeBoard) -> Optional[Tuple[int, int]]:
+    """
+    A single optimal move, preferring the center, then corners, then edges.
+
+    Returns:
+        Optional[Tuple[int, int]]: (row, col), or None if the game is over
+    """
+    moves = best_moves(board)
+    if not moves:
+        return None
+    return min(moves, key=lambda move: MOVE_ORDER.index(move[0] * 3 + move[1]))
+
+
+def classify_move(board: TicTacToeBoard, row: int, col: int) -> str:
+    """
+    Grade a legal move against perfect play, before it is made.
+
+    Returns:
+        str: "optimal" if the move keeps the position's value, "mistake" if it throws
+        away a win for a draw, "blunder" if it turns the position into a loss
+    """
+    values = move_values(board)
+    value = values[(row, col)]
+    if value == max(values.values()):
+        return "optimal"
+    return "blunder" if value == LOSS else "mistake"
@@ -0,0 +1,279 @@
+"""
+井字棋批量对战
+---------------------------------
+在不启动 Streamlit 的情况下，让两个 `provider:model` 玩家连续对战 N 局，
+并把每局的移动、每步耗时、非法移动次数和结果写入 JSONL 或 Parquet 文件。
+
+使用示例:
+---------------
+1. 命令行:
+   python tournament.py deepseek:deepseek-chat qwen:qwen-plus-latest \\
+       --games 200 --limit deepseek=4 --limit qwen=8 --output results.jsonl
+
+2. 代码调用:
+   run_tournament("deepseek:deepseek-chat", "qwen:qwen-plus-latest", games=10)
+
+对局在线程池中并发运行，每个提供者的同时请求数由各自的信号量限制。
+每局结束时立即追加写入 JSONL (输出为 .parquet 时写在同名 .jsonl 中)，中途崩溃或中断不会丢失已完成的对局；
+Parquet 文件在全部对局结束后写入。
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from agent import get_tic_tac_toe_players
+from agno.utils.log import logger
+from referee import new_move_stats, resolve_move
+from solver import classify_move
+from utils import O_PLAYER, X_PLAYER, TicTacToeBoard, get_move_prompt
+
+DEFAULT_PROVIDER_LIMIT = 4
+
+# Every Parquet row carries all of these; failed games only have the first three and "error"
+RESULT_COLUMNS = [
+    "game_id",
+    "model_x",
+    "model_o",
+    "winner",
+    "outcome",
+    "num_moves",
+    "illegal_moves_x",
+    "illegal_moves_o",
+    "stats_x",
+    "stats_o",
+    "duration_s",
+    "moves",
+    "error",
+]
+
+
+def play_game(
+    game_id: int,
+    model_x: str,
+    model_o: str,
+    limits: Dict[str, threading.Semaphore],
+    debug_mode: bool = False,
+    encoding: str = "ascii",
+) -> Dict:
+    """
+    Play one complete game between two model specs.
+
+    Args:
+        game_id: Index of the game in the tournament
+        model_x: `provider:model` spec playing X
+        model_o: `provider:model` spec playing O
+        limits: Per-provider semaphores bounding concurrent model calls
+        debug_mode: Enable agent debug logging
+        encoding: Board encoding for prompts, "ascii" or "compact"
+
+    Returns:
+        Dict: One result row (moves, per-move latency, illegal move counts and outcome)
+    """
+    player_x, player_o = get_tic_tac_toe_players(
+        model_x=model_x, model_o=model_o, debug_mode=debug_mode, encoding=encoding
+    )
+    agents = {X_PLAYER: player_x, O_PLAYER: player_o}
+    specs = {X_PLAYER: model_x, O_PLAYER: model_o}
+    board = TicTacToeBoard()
+    moves: List[Dict] = []
+    stats = {X_PLAYER: new_move_stats(), O_PLAYER: new_move_stats()}
+    started = time.perf_counter()
+
+    while not board.get_game_state()[0]:
+        player = board.current_player
+        provider = specs[player].split(":")[0]
+
+        with limits[provider]:
+            # Timed inside the semaphore so waiting for a slot is not counted as model latency
+            move_started = time.perf_counter()
+            response = agents[player].run(get_move_prompt(board, encoding), stream=False)
+            move, source, tokens = resolve_move(
+                agents[player], board, response, stats[player], encoding
+            )
+            latency = time.perf_counter() - move_started
+
+        reply = response.content if response else None
+        row, col = move
+        quality = classify_move(board, row, col)
+        board.make_move(row, col)
+        moves.append(
+            {
+                "player": player,
+                "move": f"{row},{col}",
+                "reply": reply,
+                "latency_s": round(latency, 4),
+                "quality": quality,
+                "source": source,
+                "tokens": tokens,
+            }
+        )
+
+    return {
+        "game_id": game_id,
+        "model_x": model_x,
+        "model_o": model_o,
+        "winner": board.check_winner(),
+        "outcome": board.get_game_state()[1],
+        "num_moves": len(moves),
+        # Every rejected reply costs a retry; a rejected retry also costs a solver fallback
+        "illegal_moves_x": stats[X_PLAYER]["retries"] + stats[X_PLAYER]["solver_fallbacks"],
+        "illegal_moves_o": stats[O_PLAYER]["retries"] + stats[O_PLAYER]["solver_fallbacks"],
+        "stats_x": stats[X_PLAYER],
+        "stats_o": stats[O_PLAYER],
+        "duration_s": round(time.perf_counter() - started, 4),
+        "moves": moves,
+    }
+
+
+def _write_parquet(rows: List[Dict], output: Path) -> None:
+    """Write result rows as Parquet."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # from_pylist takes its columns from the first row, so give every row the same keys
+    columns = RESULT_COLUMNS + sorted({key for row in rows for key in row} - set(RESULT_COLUMNS))
+    table = pa.Table.from_pylist([{key: row.get(key) for key in columns} for row in rows])
+    pq.write_table(table, output)
+
+
+def run_tournament(
+    model_a: str,
+    model_b: str,
+    games: int = 10,
+    output: Optional[Path] = None,
+    provider_limits: Optional[Dict[str, int]] = None,
+    max_workers: Optional[int] = None,
+    alternate: bool = True,
+    debug_mode: bool = False,
+    encoding: str = "ascii",
+) -> List[Dict]:
+    """
+    Play `games` games between two model specs concurrently.
+
+    Args:
+        model_a: `provider:model` spec playing X in even games
+        model_b: `provider:model` spec playing O in even games
+        games: Number of games to play
+        output: Optional .jsonl or .parquet path for the results; rows are appended to the
+            .jsonl file (or a .jsonl file next to the .parquet one) as each game finishes
+        provider_limits: Max concurrent model calls per provider (default 4 each)
+        max_workers: Number of games in flight (default: sum of the provider limits)
+        alternate: Swap sides every other game so both models play X equally often
+        debug_mode: Enable agent debug logging
+        encoding: Board encoding for prompts, "ascii" or "compact"
+
+    Returns:
+        List[Dict]: Result rows ordered by game id
+    """
+    provider_limits = dict(provider_limits or {})
+    for spec in (model_a, model_b):
+        provider_limits.setdefault(spec.split(":")[0], DEFAULT_PROVIDER_LIMIT)
+    limits = {
+        provider: threading.Semaphore(limit) for provider, limit in provider_limits.items()
+    }
+    if max_workers is None:
+        max_workers = sum(provider_limits.values())
+
+    # Rows are appended to JSONL as games finish, so a crash or Ctrl-C keeps completed games;
+    # a .parquet output is written from all rows at the end, next to the JSONL log
+    jsonl_path = None
+    if output is not None:
+        jsonl_path = output.with_suffix(".jsonl") if output.suffix == ".parquet" else output
+    log = jsonl_path.open("w", encoding="utf-8") if jsonl_path is not None else None
+    lock = threading.Lock()
+    rows: List[Dict] = []
+
+    def record(future, game_id: int, model_x: str, model_o: str):
+        # Done callbacks run in the worker threads
+        try:
+            row = future.result()
+            logger.info(f"对局 {game_id} 结束: {row['outcome']} ({row['num_moves']} 步)")
+        except Exception as e:
+            logger.error(f"对局 {game_id} 出错: {e}")
+            row = {"game_id": game_id, "model_x": model_x, "model_o": model_o, "error": str(e)}
+        with lock:
+            rows.append(row)
+            if log is not None:
+                log.write(json.dumps(row, ensure_ascii=False) + "\n")
+                log.flush()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for game_id in range(games):
+                model_x, model_o = (
+                    (model_b, model_a) if alternate and game_id % 2 else (model_a, model_b)
+                )
+                future = pool.submit(
+                    play_game, game_id, model_x, model_o, limits, debug_mode, encoding
+                )
+                future.add_done_callback(partial(record, game_id=game_id, model_x=model_x, model_o=model_o))
+    finally:
+        if log is not None:
+            log.close()
+
+    rows.sort(key=lambda row: row["game_id"])
+    if output is not None and output.suffix == ".parquet":
+        _write_parquet(rows, output)
+    return rows
+
+
+def _parse_limit(value: str) -> tuple:
+    provider, _, limit = value.partition("=")
+    return provider, int(limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="井字棋批量对战")
+    parser.add_argument("model_a", help="玩家 A, 例如 deepseek:deepseek-chat")
+    parser.add_argument("model_b", help="玩家 B, 例如 qwen:qwen-plus-latest")
+    parser.add_argument("--games", type=int, default=10, help="对局数量")
+    parser.add_argument(
+        "--output", type=Path, default=Path("results.jsonl"), help="结果文件 (.jsonl 或 .parquet)"
+    )
+    parser.add_argument(
+        "--limit",
+        type=_parse_limit,
+        action="append",
+        default=[],
+        metavar="PROVIDER=N",
+        help="每个提供者的最大并发请求数",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="同时进行的对局数")
+    parser.add_argument("--no-alternate", action="store_true", help="不交换先后手")
+    parser.add_argument("--debug", action="store_true", help="启用代理调试日志")
+    parser.add_argument(
+        "--encoding", choices=["ascii", "compact"], default="ascii", help="棋盘编码"
+    )
+    args = parser.parse_args()
+
+    rows = run_tournament(
+        args.model_a,
+        args.model_b,
+        games=args.games,
+        output=args.output,
+        provider_limits=dict(args.limit),
+        max_workers=args.workers,
+        alternate=not args.no_alternate,
+        debug_mode=args.debug,
+        encoding=args.encoding,
+    )
+
+    wins: Dict[str, int] = {}
+    for row in rows:
+        if row.get("winner"):
+            spec = row["model_x"] if row["winner"] == X_PLAYER else row["model_o"]
+            wins[spec] = wins.get(spec, 0) + 1
+    draws = sum(1 for row in rows if "error" not in row and not row["winner"])
+    print(f"{args.model_a}: {wins.get(args.model_a, 0)} 胜")
+    print(f"{args.model_b}: {wins.get(args.model_b, 0)} 胜")
+    print(f"平局: {draws}, 结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import json
+import re
 from typing import List, Optional, Tuple
 
 import streamlit as st
@@ -8,12 +10,65 @@ O_PLAYER = "O"
 EMPTY = " "
 
 
+# Bit index of each cell is row * 3 + col; each player owns one 9-bit integer
+FULL_MASK = 0b111111111
+WIN_MASKS = (
+    0b000000111,  # rows
+    0b000111000,
+    0b111000000,
+    0b001001001,  # columns
+    0b010010010,
+    0b100100100,
+    0b100010001,  # diagonals
+    0b001010100,
+)
+# Precompute every 9-bit position that contains a line, so a win check is a set lookup
+WINNING_BITS = frozenset(
+    bits for bits in range(FULL_MASK + 1) if any(bits & m == m for m in WIN_MASKS)
+)
+
+
 class TicTacToeBoard:
     def __init__(self):
-        # Initialize empty 3x3 board
-        self.board = [[EMPTY for _ in range(3)] for _ in range(3)]
+        # Initialize empty board: one bitboard per player
+        self.bits = {X_PLAYER: 0, O_PLAYER: 0}
         self.current_player = X_PLAYER
 
+    @classmethod
+    def from_bits(cls, x_bits: int, o_bits: int) -> "TicTacToeBoard":
+        """
+        Create a board from the two players' bitboards; X moves when both have equal counts.
+        """
+        board = cls()
+        board.bits = {X_PLAYER: x_bits, O_PLAYER: o_bits}
+        board.current_player = (
+            X_PLAYER if bin(x_bits).count("1") == bin(o_bits).count("1") else O_PLAYER
+        )
+        return board
+
+    @property
+    def occupied(self) -> int:
+        """Bitmask of all occupied cells."""
+        return self.bits[X_PLAYER] | self.bits[O_PLAYER]
+
+    @property
+    def board(self) -> List[List[str]]:
+        """
+        3x3 list-of-lists view of the board, built on demand from the bitboards.
+        """
+        x_bits, o_bits = self.bits[X_PLAYER], self.bits[O_PLAYER]
+        return [
+            [
+                X_PLAYER
+                if x_bits >> (row * 3 + col) & 1
+                else O_PLAYER
+                if o_bits >> (row * 3 + col) & 1
+                else EMPTY
+                for col in range(3)
+            ]
+            for row in range(3)
+        ]
+
     def make_move(self, row: int, col: int) -> Tuple[bool, str]:
         """
         Make a move on the board.
@@ -33,11 +88,12 @@ class TicTacToeBoard:
             )
 
         # Check if position is already occupied
-        if self.board[row][col] != EMPTY:
+        cell = 1 << (row * 3 + col)
+        if self.occupied & cell:
             return False, f"Invalid move: Position ({row}, {col}) is already occupied."
 
         # Make the move
-        self.board[row][col] = self.current_player
+        self.bits[self.current_player] |= cell
 
         # Get board state
         board_state = self.get_board_state()
@@ -63,33 +119,17 @@ class TicTacToeBoard:
         Returns:
             Optional[str]: The winning player (X or O) or None if no winner
         """
-        # Check rows
-        for row in self.board:
-            if row.count(row[0]) == 3 and row[0] != EMPTY:
-                return row[0]
-
-        # Check columns
-        for col in range(3):
-            column = [self.board[row][col] for row in range(3)]
-            if column.count(column[0]) == 3 and column[0] != EMPTY:
-                return column[0]
-
-        # Check diagonals
-        diagonal1 = [self.board[i][i] for i in range(3)]
-        if diagonal1.count(diagonal1[0]) == 3 and diagonal1[0] != EMPTY:
-            return diagonal1[0]
-
-        diagonal2 = [self.board[i][2 - i] for i in range(3)]
-        if diagonal2.count(diagonal2[0]) == 3 and diagonal2[0] != EMPTY:
-            return diagonal2[0]
-
+        if self.bits[X_PLAYER] in WINNING_BITS:
+            return X_PLAYER
+        if self.bits[O_PLAYER] in WINNING_BITS:
+            return O_PLAYER
         return None
 
     def is_board_full(self) -> bool:
         """
         Check if the board is full (draw condition).
         """
-        return all(cell != EMPTY for row in self.board for cell in row)
+        return self.occupied == FULL_MASK
 
     def get_valid_moves(self) -> List[Tuple[int, int]]:
         """
@@ -98,12 +138,8 @@ class TicTacToeBoard:
         Returns:
             List[Tuple[int, int]]: List of (row, col) tuples representing valid moves
         """
-        valid_moves = []
-        for row in range(3):
-            for col in range(3):
-                if self.board[row][col] == EMPTY:
-                    valid_moves.append((row, col))
-        return valid_moves
+        empty = ~self.occupied & FULL_MASK
+        return [divmod(i, 3) for i in range(9) if empty >> i & 1]
 
     def get_game_state(self) -> Tuple[bool, str]:
         """
@@ -122,6 +158,63 @@ class TicTacToeBoard:
         return False, "Game in progress"
 
 
+def encode_board(board: TicTacToeBoard) -> str:
+    """
+    Encode the board as 9 characters in row order, "." for an empty cell (e.g. "X.O.X....").
+    """
+    return "".join(cell if cell != EMPTY else "." for row in board.board for cell in row)
+
+
+def get_move_prompt(board: TicTacToeBoard, encoding: str = "ascii") -> str:
+    """
+    Build the prompt asking the player to move in the current position.
+
+    Args:
+        board (TicTacToeBoard): Current position
+        encoding (str): "ascii" for the drawn board and (row, col) moves, "compact" for the
+            9-character board and cell indices 0-8 (rules live in the agent's system prompt)
+    """
+    if encoding == "compact":
+        indices = ",".join(str(row * 3 + col) for row, col in board.get_valid_moves())
+        return f"棋盘: {encode_board(board)}\n有效: {indices}"
+
+    return f"""\
+当前棋盘状态:\n{board.get_board_state()}\n
+有效移动 (行, 列): {board.get_valid_moves()}\n
+选择你下一步的移动，从上面的有效移动中选择。
+只回复 JSON, 例如 {{"row": 1, "col": 2}}。"""
+
+
+def parse_move(reply: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    Extract a (row, col) move from a player's reply.
+
+    Accepts, in order of preference: a JSON object with "row"/"col" (or a "move" cell index
+    0-8), two numbers "row col", or a single cell index 0-8.
+
+    Returns:
+        Optional[Tuple[int, int]]: The parsed move, or None if the reply contains no move
+    """
+    reply = reply or ""
+    match = re.search(r"\{[^{}]*\}", reply)
+    if match:
+        try:
+            data = json.loads(match.group(0))
+            if "row" in data and "col" in data:
+                return int(data["row"]), int(data["col"])
+            if "move" in data:
+                return divmod(int(data["move"]), 3)
+        except (ValueError, TypeError):
+            pass
+
+    numbers = re.findall(r"\d+", reply)
+    if len(numbers) >= 2:
+        return int(numbers[0]), int(numbers[1])
+    if len(numbers) == 1 and int(numbers[0]) < 9:
+        return divmod(int(numbers[0]), 3)
+    return None
+
+
 def display_board(board: TicTacToeBoard):
     """Display the Tic Tac Toe board using Streamlit"""
     board_html = '<div class="game-board">'
@@ -162,69 +255,98 @@ def create_mini_board_html(
     return html
 
 
-def display_move_history():
-    """Display the move history with mini boards in two columns"""
-    st.markdown(
-        '<h3 style="margin-bottom: 30px;">📜 Game History</h3>',
-        unsafe_allow_html=True,
-    )
-    history_container = st.empty()
+def move_quality_html(move: dict) -> str:
+    """Create HTML for the solver grade of a move, if it has one"""
+    if "quality" not in move:
+        return ""
+    label = move["quality"] + (" · solver fallback" if move.get("fallback") else "")
+    return f'<div class="move-quality {move["quality"]}">{label}</div>'
 
-    if "move_history" in st.session_state and st.session_state.move_history:
-        # Split moves into player 1 and player 2 moves
-        p1_moves = []
-        p2_moves = []
-        current_board = [[" " for _ in range(3)] for _ in range(3)]
 
-        # Process all moves first
-        for move in st.session_state.move_history:
-            row, col = map(int, move["move"].split(","))
-            is_player1 = "Player 1" in move["player"]
-            symbol = "X" if is_player1 else "O"
-            current_board[row][col] = symbol
-            board_copy = [row[:] for row in current_board]
+def move_tokens_html(move: dict) -> str:
+    """Create HTML for the token usage of a move, if it was recorded"""
+    if "tokens" not in move:
+        return ""
+    tokens = move["tokens"]
+    return (
+        '<div style="font-size: 0.8em; color: #888">'
+        f"Tokens: in {tokens['input_tokens']} · out {tokens['output_tokens']}"
+        f" · cached {tokens['cached_tokens']}</div>"
+    )
 
-            move_html = f"""<div class="move-entry player{1 if is_player1 else 2}">
-                {create_mini_board_html(board_copy, (row, col), is_player1)}
+
+def create_move_entry_html(move: dict, board_state: list) -> str:
+    """Create HTML for one move history entry"""
+    row, col = map(int, move["move"].split(","))
+    is_player1 = "Player 1" in move["player"]
+    return f"""<div class="move-entry player{1 if is_player1 else 2}">
+                {create_mini_board_html(board_state, (row, col), is_player1)}
                 <div class="move-info">
                     <div class="move-number player{1 if is_player1 else 2}">Move #{move["number"]}</div>
                     <div>{move["player"]}</div>
                     <div style="font-size: 0.9em; color: #888">Position: ({row}, {col})</div>
+                    {move_quality_html(move)}
+                    {move_tokens_html(move)}
                 </div>
             </div>"""
 
-            if is_player1:
-                p1_moves.append(move_html)
-            else:
-                p2_moves.append(move_html)
-
-        max_moves = max(len(p1_moves), len(p2_moves))
-        history_content = '<div class="history-grid">'
-
-        # Left column (Player 1)
-        history_content += '<div class="history-column-left">'
-        for i in range(max_moves):
-            entry_html = ""
-            # Player 1 move
-            if i < len(p1_moves):
-                entry_html += p1_moves[i]
-            history_content += entry_html
-        history_content += "</div>"
-
-        # Right column (Player 2)
-        history_content += '<div class="history-column-right">'
-        for i in range(max_moves):
-            entry_html = ""
-            # Player 2 move
-            if i < len(p2_moves):
-                entry_html += p2_moves[i]
-            history_content += entry_html
-        history_content += "</div>"
-
-        history_content += "</div>"
-
-        # Display the content
-        history_container.markdown(history_content, unsafe_allow_html=True)
+
+def get_history_render_cache() -> dict:
+    """
+    Bring the cached move history rendering up to date with st.session_state.move_history.
+
+    Only moves appended since the last call are rendered; each gets a board snapshot and an
+    HTML fragment. The cache is rebuilt when a new game replaces the history list.
+
+    Returns:
+        dict: Cache with per-move "snapshots", per-player "p1"/"p2" fragments and the joined "html"
+    """
+    history = st.session_state.move_history
+    cache = st.session_state.get("history_render")
+    if cache is None or cache["history"] is not history or cache["count"] > len(history):
+        cache = {
+            "history": history,
+            "count": 0,
+            "snapshots": [],
+            "p1": [],
+            "p2": [],
+            "html": None,
+        }
+        st.session_state.history_render = cache
+
+    if cache["count"] < len(history):
+        board = (
+            [list(row) for row in cache["snapshots"][-1]]
+            if cache["snapshots"]
+            else [[EMPTY for _ in range(3)] for _ in range(3)]
+        )
+        for move in history[cache["count"] :]:
+            row, col = map(int, move["move"].split(","))
+            is_player1 = "Player 1" in move["player"]
+            board[row][col] = X_PLAYER if is_player1 else O_PLAYER
+            snapshot = tuple(tuple(r) for r in board)
+            cache["snapshots"].append(snapshot)
+            cache["p1" if is_player1 else "p2"].append(create_move_entry_html(move, snapshot))
+        cache["count"] = len(history)
+        cache["html"] = (
+            '<div class="history-grid">'
+            f'<div class="history-column-left">{"".join(cache["p1"])}</div>'
+            f'<div class="history-column-right">{"".join(cache["p2"])}</div>'
+            "</div>"
+        )
+    return cache
+
+
+def display_move_history():
+    """Display the move history with mini boards in two columns"""
+    st.markdown(
+        '<h3 style="margin-bottom: 30px;">📜 Game History</h3>',
+        unsafe_allow_html=True,
+    )
+    history_container = st.empty()
+
+    if "move_history" in st.session_state and st.session_state.move_history:
+        history_container.markdown(get_history_render_cache()["html"], unsafe_allow_html=True)
     else:
         history_container.markdown(
             """<div style="text-align: center; color: #666; padding: 20px;">
@@ -412,5 +534,21 @@ CUSTOM_CSS = """
 .move-number.player2 {
     color: #f44336;
 }
+
+.move-quality {
+    font-size: 0.85em;
+}
+
+.move-quality.optimal {
+    color: #4CAF50;
+}
+
+.move-quality.mistake {
+    color: #FFA500;
+}
+
+.move-quality.blunder {
+    color: #f44336;
+}
 </style>
 """
\ No newline at end of file
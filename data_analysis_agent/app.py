@@ -6,6 +6,42 @@ from agno.models.deepseek import DeepSeek
 
 import os
 
+from ingest import get_upload_hash, ingest_upload, preview_dataset
+
+
+def get_pandas_tools(dataset):
+    """
+    会话内按数据集哈希只加载一次完整数据 (Arrow 类型), 之后的重跑和分析直接复用
+
+    数据框以原对象放入 PandasTools, 不复制; 换了文件时先释放旧的数据再加载
+    """
+    cached = st.session_state.get("pandas_tools")
+    if cached is None or cached[0] != dataset["hash"]:
+        st.session_state.pandas_tools = None
+        pandas_tools = PandasTools()
+        pandas_tools.dataframes["uploaded_data"] = pd.read_parquet(
+            dataset["parquet"], dtype_backend="pyarrow"
+        )
+        st.session_state.pandas_tools = (dataset["hash"], pandas_tools)
+    return st.session_state.pandas_tools[1]
+
+
+def show_memory_usage():
+    """在侧边栏显示会话中数据框占用的内存"""
+    cached = st.session_state.get("pandas_tools")
+    if cached is None:
+        return
+    dataframes = cached[1].dataframes
+    usage = {
+        name: df.memory_usage(deep=True).sum() / 1024 / 1024
+        for name, df in dataframes.items()
+        if isinstance(df, pd.DataFrame)
+    }
+    st.sidebar.header("内存占用")
+    st.sidebar.metric("数据框合计", f"{sum(usage.values()):.1f} MB")
+    for name, mb in usage.items():
+        st.sidebar.caption(f"`{name}`: {mb:.1f} MB")
+
 
 def main():
     st.set_page_config(page_title="AI 数据分析智能体", layout="wide")
@@ -23,13 +59,16 @@ def main():
     if uploaded_file is not None:
         try:
             st.sidebar.info(f"已上传文件: `{uploaded_file.name}`")
-            if uploaded_file.name.endswith(".csv"):
-                df = pd.read_csv(uploaded_file)
-            else:
-                df = pd.read_excel(uploaded_file, engine="openpyxl")
+            with st.spinner("正在导入数据..."):
+                dataset = ingest_upload(uploaded_file, get_upload_hash(uploaded_file))
 
+            # 预览只读取前几行和聚合统计, 完整数据在开始分析时才加载
+            preview, column_info = preview_dataset(dataset)
             st.write("数据预览 (前5行):")
-            st.dataframe(df.head())
+            st.dataframe(preview)
+            st.caption(f"共 {dataset['rows']} 行, {len(dataset['columns'])} 列")
+            with st.expander("📊 查看列信息"):
+                st.dataframe(column_info)
 
             question = st.text_area("请输入您关于数据的问题:", height=150)
 
@@ -44,10 +83,9 @@ def main():
                             # 为 Agent 设置 API Key
                             os.environ["DEEPSEEK_API_KEY"] = deepseek_api_key
 
-                            # 初始化 Agent - 使用正确的 PandasTools 初始化方式
-                            pandas_tools = PandasTools()
-                            # 将数据框添加到工具中
-                            pandas_tools.dataframes["uploaded_data"] = df
+                            # 完整数据在会话内只加载一次, PandasTools 和它生成的数据框都保留在会话中
+                            with st.spinner("正在加载完整数据..."):
+                                pandas_tools = get_pandas_tools(dataset)
 
                             agent = Agent(
                                 model=DeepSeek(api_key=deepseek_api_key),
@@ -76,6 +114,8 @@ def main():
         except Exception as e:
             st.error(f"读取文件时出错: {e}")
 
+    show_memory_usage()
+
 
 if __name__ == "__main__":
     main()
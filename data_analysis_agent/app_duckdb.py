@@ -1,35 +1,227 @@
 import streamlit as st
-import pandas as pd
 import os
-import tempfile
-import shutil
-from pathlib import Path
 from agno.agent import Agent
-from agno.tools.duckdb import DuckDbTools
 from agno.models.deepseek import DeepSeek
+import pyarrow as pa
+
+from ingest import (
+    connect_dataset,
+    excel_sheets,
+    get_upload_hash,
+    ingest_upload,
+    is_excel,
+    preview_dataset,
+    stage_upload,
+)
+from profiling import format_profile, load_profile
+from plan_cache import PlanCache
+from sql_tools import (
+    CachedDuckDbTools,
+    QueryResultCache,
+    is_exploratory,
+    is_read_only,
+    normalize_sql,
+)
+from workspace import Workspace
+
+
+# Rows of each query result shown in the page; the model gets its own, smaller limit
+UI_PREVIEW_ROWS = 1000
+
+
+@st.cache_resource
+def get_query_cache():
+    """所有会话共享的 SQL 结果缓存"""
+    return QueryResultCache(max_bytes=256 * 1024 * 1024)
+
+
+@st.cache_resource
+def get_plan_cache():
+    """问题 → SQL 的持久化缓存"""
+    return PlanCache()
+
+
+def stream_results(container, max_rows=UI_PREVIEW_ROWS):
+    """返回 CachedDuckDbTools 的 on_batch 回调: 每条查询的结果分批显示在一个占位元素中, 最多 max_rows 行"""
+    shown = {}
+
+    def on_batch(index, query, batch):
+        if index not in shown:
+            with container:
+                st.code(query, language="sql")
+                shown[index] = [st.empty(), []]
+        placeholder, batches = shown[index]
+        rows = sum(b.num_rows for b in batches)
+        if rows < max_rows:
+            # Re-render the whole preview; st.dataframe().add_rows is gone from current Streamlit
+            batches.append(batch.slice(0, max_rows - rows))
+            placeholder.dataframe(pa.Table.from_batches(batches).to_pandas())
+
+    return on_batch
+
+
+def offer_downloads(spilled):
+    """为超出返回行数、已写入 Parquet 的完整结果提供下载"""
+    for i, (query, path, rows) in enumerate(spilled):
+        if not path.exists():
+            # Pruned to keep the results directory within its size limit
+            continue
+        with open(path, "rb") as f:
+            st.download_button(
+                f"⬇️ 下载完整结果 ({rows} 行, Parquet)",
+                f,
+                file_name=path.name,
+                key=f"spill-{i}-{path.name}",
+                help=query,
+            )
+
 
+def replay_plan(plan, dataset):
+    """重新执行缓存的 SQL, 不调用模型"""
+    connection = connect_dataset(dataset)
+    st.success("✅ 已复用缓存的分析方案, 未调用模型")
+    st.write("### 🗂️ 查询结果:")
+    for query in plan["queries"]:
+        st.code(query, language="sql")
+        st.dataframe(connection.sql(query).limit(UI_PREVIEW_ROWS).df())
 
-def save_uploaded_file_to_temp(uploaded_file):
-    """将上传的文件保存到临时目录"""
-    # 创建临时目录
-    temp_dir = tempfile.mkdtemp()
+    if plan["dataset_hash"] == dataset["hash"]:
+        st.write("### 📋 分析结果:")
+        st.markdown(plan["answer"])
+    else:
+        st.info("表结构相同但数据不同, 上次的文字分析不再适用, 以上是在当前数据上重新执行的结果。")
 
-    # 构建文件路径
-    file_path = os.path.join(temp_dir, uploaded_file.name)
 
-    # 保存文件
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+def render_cache_stats(container, query_cache):
+    """在侧边栏显示 SQL 结果缓存的命中率和占用"""
+    with container:
+        st.metric("命中率", f"{query_cache.hit_rate:.0%}")
+        st.caption(
+            f"命中 {query_cache.stats['hits']} / 未命中 {query_cache.stats['misses']} · "
+            f"{len(query_cache.entries)} 条结果, {query_cache.size / 1024 / 1024:.1f} MB · "
+            f"淘汰 {query_cache.stats['evictions']}"
+        )
 
-    return file_path, temp_dir
 
+def get_workspace(uploaded_files):
+    """同一组上传文件在会话内复用同一个工作区, 已转换的表不会重复转换"""
+    digests = tuple(get_upload_hash(f) for f in uploaded_files)
+    workspace = st.session_state.get("workspace")
+    if workspace is None or st.session_state.get("workspace_files") != digests:
+        workspace = Workspace()
+        for uploaded_file, digest in zip(uploaded_files, digests):
+            workspace.add_upload(uploaded_file, digest)
+        st.session_state.workspace = workspace
+        st.session_state.workspace_files = digests
+    return workspace
+
+
+def workspace_page(deepseek_api_key, query_cache, preview_rows):
+    """多文件工作区: 每个文件一个视图, 智能体可以跨文件查询"""
+    uploaded_files = st.file_uploader(
+        "上传多个 CSV、Excel 或 Parquet 文件",
+        type=["csv", "xlsx", "xls", "parquet"],
+        accept_multiple_files=True,
+        help="每个文件注册为一张表, 表名为文件名; 文件在第一次被查询时才转换为 Parquet",
+    )
+    if not uploaded_files:
+        st.markdown(
+            """
+        ### 📖 工作区模式
+        
+        - 一次上传多个文件 (例如按月拆分的数据), 每个文件成为一张表
+        - 结构相同的表会提示可以 UNION ALL 合并, 不同表之间会推断候选连接键
+        - 文件只在查询第一次用到时转换为 Parquet, 之后的会话直接复用
+        """
+        )
+        return
 
-def cleanup_temp_dir(temp_dir):
-    """清理临时目录"""
     try:
-        shutil.rmtree(temp_dir)
+        with st.spinner("正在注册数据文件..."):
+            workspace = get_workspace(uploaded_files)
+            workspace_text = workspace.describe()
     except Exception as e:
-        st.warning(f"清理临时文件时出现警告: {e}")
+        st.error(f"❌ 读取文件时出错: {e}")
+        return
+
+    st.write("### 🗂️ 工作区")
+    st.dataframe(
+        [
+            {
+                "表名": table,
+                "文件": entry["name"],
+                "列数": len(workspace.columns(table)),
+                "行数": workspace.rows(table),
+                "已转换为 Parquet": entry["meta"] is not None,
+            }
+            for table, entry in workspace.tables.items()
+        ]
+    )
+    candidates = workspace.join_candidates()
+    if candidates:
+        with st.expander("🔗 候选连接键"):
+            st.dataframe(candidates)
+
+    question = st.text_area(
+        "请输入您的数据分析问题 (可以跨多张表):",
+        height=150,
+        placeholder="例如: 比较各个月份的销售额变化\n或者: 把订单表和客户表关联, 统计各地区的订单数",
+    )
+    if st.button("🚀 开始分析", type="primary"):
+        if not deepseek_api_key:
+            st.error("❌ 请输入您的 DEEPSEEK API Key。")
+        elif not question:
+            st.error("❌ 请输入您的问题。")
+        else:
+            with st.spinner("🔍 正在使用 DuckDB 分析您的数据，请稍候..."):
+                try:
+                    os.environ["DEEPSEEK_API_KEY"] = deepseek_api_key
+                    # 查询引用到的表在执行前才转换为 Parquet
+                    duckdb_tools = CachedDuckDbTools(
+                        cache=query_cache,
+                        dataset_hash=workspace.fingerprint,
+                        prepare=workspace.prepare,
+                        on_batch=stream_results(st.expander("🗂️ 查询过程", expanded=True)),
+                        preview_rows=preview_rows,
+                        connection=workspace.connection,
+                    )
+                    agent = Agent(
+                        model=DeepSeek(api_key=deepseek_api_key),
+                        tools=[duckdb_tools],
+                        markdown=True,
+                        instructions=f"""你是一个专业的数据分析师，擅长使用 SQL 查询分析数据。
+
+                                        用户上传了多个文件，每个文件都已注册为 DuckDB 视图，可以直接查询，
+                                        也可以在一条查询中连接 (JOIN) 或合并 (UNION ALL) 多张表。
+                                        表名请使用双引号。
+
+{workspace_text}
+
+                                        请根据用户的问题编写 SQL 查询并给出清晰的分析结果和见解。
+""",
+                        debug_mode=True,
+                    )
+                    response = agent.run(f"用户问题: {question}")
+
+                    st.success("✅ 分析完成!")
+                    st.write("### 📋 分析结果:")
+                    if hasattr(response, "content"):
+                        st.markdown(response.content)
+                    else:
+                        st.markdown(str(response))
+                    offer_downloads(duckdb_tools.spilled)
+                except Exception as e:
+                    st.error(f"❌ 分析过程中出现错误: {e}")
+                    with st.expander("🔍 查看详细错误信息"):
+                        st.code(str(e))
+
+
+def get_sheet_names(uploaded_file, digest):
+    """Excel 文件的工作表名称, 会话内只读取一次"""
+    sheet_names = st.session_state.setdefault("sheet_names", {})
+    if digest not in sheet_names:
+        sheet_names[digest] = excel_sheets(stage_upload(uploaded_file, digest))
+    return sheet_names[digest]
 
 
 def main():
@@ -43,6 +235,27 @@ def main():
     deepseek_api_key = st.sidebar.text_input(
         "请输入您的 DEEPSEEK API Key", type="password"
     )
+    query_cache = get_query_cache()
+    plan_cache = get_plan_cache()
+    cache_stats = st.sidebar.expander("SQL 结果缓存")
+    profile_budget = st.sidebar.number_input(
+        "列统计提示长度上限 (字符)", min_value=500, max_value=20000, value=3000, step=500
+    )
+    preview_rows = st.sidebar.number_input(
+        "每条查询返回给模型的最大行数",
+        min_value=10,
+        max_value=1000,
+        value=50,
+        step=10,
+        help="超出的完整结果保存为 Parquet, 可在页面中下载",
+    )
+    mode = st.sidebar.radio(
+        "分析模式", ["单文件", "多文件工作区"], help="工作区模式可以一次上传多个文件并跨文件查询"
+    )
+    if mode == "多文件工作区":
+        workspace_page(deepseek_api_key, query_cache, preview_rows)
+        render_cache_stats(cache_stats, query_cache)
+        return
 
     # Main content
     uploaded_file = st.file_uploader(
@@ -52,59 +265,65 @@ def main():
     )
 
     if uploaded_file is not None:
-        temp_dir = None
         try:
             st.sidebar.info(f"已上传文件: `{uploaded_file.name}`")
 
-            # 保存文件到临时目录
-            with st.spinner("正在保存文件到临时目录..."):
-                file_path, temp_dir = save_uploaded_file_to_temp(uploaded_file)
-                st.sidebar.success(f"文件已保存到: `{file_path}`")
-
-            # 读取并预览数据
-            if uploaded_file.name.endswith(".csv"):
-                df = pd.read_csv(file_path)
-            else:
-                df = pd.read_excel(file_path, engine="openpyxl")
+            digest = get_upload_hash(uploaded_file)
+            sheet = None
+            if is_excel(uploaded_file.name):
+                sheets = get_sheet_names(uploaded_file, digest)
+                if len(sheets) > 1:
+                    sheet = st.selectbox(
+                        "选择工作表",
+                        sheets,
+                        help="每个工作表单独导入为一张表; 需要同时分析多个工作表时请使用多文件工作区模式",
+                    )
+
+            # 按内容哈希导入, 同一文件只转换一次 Parquet, 之后的重跑和会话直接复用
+            with st.spinner("正在导入数据..."):
+                dataset = ingest_upload(uploaded_file, digest, sheet)
+            file_path = dataset["parquet"]
+            table_name = dataset["table"]
+            st.sidebar.success(f"数据已缓存到: `{file_path}`")
+
+            # 只读取前几行和聚合统计, 不把整张表加载到内存
+            preview, column_info = preview_dataset(dataset)
+
+            # 列统计对每个数据集只计算一次, 写入智能体提示以减少探索性查询
+            with st.spinner("正在生成列统计..."):
+                profile = load_profile(dataset)
+            profile_text = format_profile(profile, budget=profile_budget)
 
             st.write("数据预览 (前5行):")
-            st.dataframe(df.head())
+            st.dataframe(preview)
 
             # 显示数据基本信息
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("总行数", len(df))
+                st.metric("总行数", dataset["rows"])
             with col2:
-                st.metric("总列数", len(df.columns))
+                st.metric("总列数", len(dataset["columns"]))
             with col3:
                 st.metric("文件大小", f"{uploaded_file.size / 1024:.1f} KB")
 
             # 显示列信息
             with st.expander("📊 查看列信息"):
                 st.write("列名和数据类型:")
-                column_info = pd.DataFrame(
-                    {
-                        "列名": df.columns,
-                        "数据类型": df.dtypes.astype(str),
-                        "非空值数量": df.count(),
-                        "缺失值数量": df.isnull().sum(),
-                    }
-                )
                 st.dataframe(column_info)
 
             # SQL 查询建议
             st.write("### 💡 SQL 查询建议")
             st.code(
                 f"""
-                    -- 基础查询示例 (表名: '{Path(uploaded_file.name).stem}')
-                    SELECT * FROM '{Path(uploaded_file.name).stem}' LIMIT 10;
+                    -- 基础查询示例 (表名: "{table_name}")
+                    SELECT * FROM "{table_name}" LIMIT 10;
 
                     -- 统计分析示例
-                    SELECT COUNT(*) as total_rows FROM '{Path(uploaded_file.name).stem}';
+                    SELECT COUNT(*) as total_rows FROM "{table_name}";
 
                     -- 按列分组统计 (请根据实际列名修改)
                     SELECT column_name, COUNT(*) 
-                    FROM '{Path(uploaded_file.name).stem}' 
+                    FROM "{table_name}" 
                     GROUP BY column_name 
                     ORDER BY COUNT(*) DESC; 
                 """,
@@ -117,22 +336,42 @@ def main():
                 placeholder="例如: 帮我分析这个数据集的基本统计信息\n或者: 查询销售额最高的前10个产品",
             )
 
+            force_refresh = st.checkbox(
+                "重新分析", help="忽略缓存的分析方案, 重新调用模型生成 SQL"
+            )
+
             if st.button("🚀 开始分析", type="primary"):
-                if not deepseek_api_key:
-                    st.error("❌ 请输入您的 DEEPSEEK API Key。")
-                elif not question:
+                plan = None
+                if question and not force_refresh:
+                    plan = plan_cache.get(dataset, question)
+
+                if not question:
                     st.error("❌ 请输入您的问题。")
+                elif plan is not None:
+                    try:
+                        replay_plan(plan, dataset)
+                    except Exception as e:
+                        st.error(f"❌ 执行缓存的 SQL 时出错, 请勾选“重新分析”: {e}")
+                elif not deepseek_api_key:
+                    st.error("❌ 请输入您的 DEEPSEEK API Key。")
                 else:
                     with st.spinner("🔍 正在使用 DuckDB 分析您的数据，请稍候..."):
                         try:
                             # 为 Agent 设置 API Key
                             os.environ["DEEPSEEK_API_KEY"] = deepseek_api_key
 
-                            # 初始化 DuckDbTools
-                            duckdb_tools = DuckDbTools()
-
-                            # 获取表名 (使用文件名作为表名，去除扩展名)
-                            table_name = Path(uploaded_file.name).stem
+                            # 初始化 DuckDbTools, 数据集已注册为以文件名命名的视图;
+                            # 查询结果按数据集哈希和规范化 SQL 缓存, 重复的查询直接返回
+                            # 结果分批读取, 模型只收到前几行, 页面中流式显示查询结果
+                            duckdb_tools = CachedDuckDbTools(
+                                cache=query_cache,
+                                dataset_hash=dataset["hash"],
+                                on_batch=stream_results(
+                                    st.expander("🗂️ 查询过程", expanded=True)
+                                ),
+                                preview_rows=preview_rows,
+                                connection=connect_dataset(dataset),
+                            )
 
                             agent = Agent(
                                 model=DeepSeek(api_key=deepseek_api_key),
@@ -140,8 +379,9 @@ def main():
                                 markdown=True,
                                 instructions=f"""你是一个专业的数据分析师，擅长使用 SQL 查询分析数据。
 
-                                                用户上传了一个名为 '{uploaded_file.name}' 的文件，文件路径为: {file_path}
-                                                该文件已经可以通过 DuckDB 访问，表名为: '{table_name}'
+                                                用户上传了一个名为 '{uploaded_file.name}' 的文件，已导入为 Parquet: {file_path}
+                                                该数据已经注册为 DuckDB 视图，可以直接查询，表名为: "{table_name}"
+                                                不要再从文件路径加载数据，直接查询该表即可
 
                                                 请根据用户的问题进行数据分析：
                                                 1. 如果用户问的是自然语言问题，请先理解用户需求，然后编写合适的SQL查询
@@ -149,18 +389,16 @@ def main():
                                                 3. 请提供清晰的分析结果和见解
                                                 4. 如果需要，可以提供多个SQL查询来全面分析数据
 
-                                                文件列信息：
-                                                {df.columns.tolist()}
-
-                                                数据类型：
-                                                {df.dtypes.to_dict()}
+                                                该表共 {dataset["rows"]} 行, 各列统计 (列名、类型、基数、缺失比例、取值范围、常见值和示例值) 如下,
+                                                可以直接据此编写查询, 不需要先查询表结构或样例数据：
+{profile_text}
 """,
                                 debug_mode=True,
                             )
 
                             # 构建完整的 prompt
                             prompt = f"""
-                                        请分析位于 '{file_path}' 的数据文件，表名为 '{table_name}'。
+                                        请分析 DuckDB 表 "{table_name}"。
                                         用户问题: {question}
                                         请使用 DuckDB SQL 查询来分析数据并回答用户的问题。"""
 
@@ -172,9 +410,21 @@ def main():
 
                             # 检查 response 的类型并正确显示内容
                             if hasattr(response, "content"):
-                                st.markdown(response.content)
+                                answer = response.content
                             else:
-                                st.markdown(str(response))
+                                answer = str(response)
+                            st.markdown(answer)
+                            offer_downloads(duckdb_tools.spilled)
+
+                            # 只保存得出结论的只读 SQL, 不包括查看表结构和样例行的探索性查询,
+                            # 同样的问题下次直接重新执行
+                            queries = [
+                                query
+                                for query in dict.fromkeys(duckdb_tools.executed_queries)
+                                if is_read_only(normalize_sql(query))
+                                and not is_exploratory(normalize_sql(query))
+                            ]
+                            plan_cache.put(dataset, question, queries, answer)
 
                         except Exception as e:
                             st.error(f"❌ 分析过程中出现错误: {e}")
@@ -188,11 +438,6 @@ def main():
         except Exception as e:
             st.error(f"❌ 读取文件时出错: {e}")
 
-        finally:
-            # 清理临时文件
-            if temp_dir and os.path.exists(temp_dir):
-                cleanup_temp_dir(temp_dir)
-
     else:
         # 显示使用说明
         st.markdown(
@@ -223,6 +468,9 @@ def main():
         """
         )
 
+    # 放在最后渲染, 统计包含本次运行中的查询
+    render_cache_stats(cache_stats, query_cache)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,184 @@
+"""
+Excel 流式导入
+
+逐行读取工作表并分块写入 Parquet, 不把整个工作簿加载到 pandas。
+安装了 python-calamine 时用它读取 (Rust 实现, 也支持 .xls), 否则用 openpyxl 的只读模式。
+两种方式读出的单元格值统一为与 pd.read_excel 相同的类型: 整数为 BIGINT, 日期为 TIMESTAMP。
+
+各块的列类型分别推断; 后面的块与前面不兼容时 (例如整数列出现小数), 类型按 int → double → 字符串
+提升并另起一个分段文件, 最后由 DuckDB 按列名合并各分段。
+"""
+
+import shutil
+import tempfile
+from datetime import date, datetime, time
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ingest import sql_literal
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # pragma: no cover - optional dependency
+    CalamineWorkbook = None
+
+CHUNK_ROWS = 50_000
+
+
+def sheet_names(path: Path) -> List[str]:
+    """工作簿中的工作表名称"""
+    if CalamineWorkbook is not None:
+        return CalamineWorkbook.from_path(str(path)).sheet_names
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def _cell(value):
+    """
+    统一两种读取方式的单元格值, 与 pd.read_excel 一致:
+    整数值的浮点数转为 int (calamine 把所有数字读为 float), 日期转为当天零点的 datetime
+    (calamine 对只有日期的单元格返回 date, openpyxl 返回 datetime)
+    """
+    if isinstance(value, float) and value.is_integer() and abs(value) < 2**63:
+        return int(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, time())
+    return value
+
+
+def iter_rows(path: Path, sheet: str) -> Iterator[tuple]:
+    """逐行读取工作表, 空单元格为 None"""
+    if CalamineWorkbook is not None:
+        worksheet = CalamineWorkbook.from_path(str(path)).get_sheet_by_name(sheet)
+        rows = worksheet.iter_rows() if hasattr(worksheet, "iter_rows") else worksheet.to_python()
+        for row in rows:
+            # calamine reports empty cells as ""
+            yield tuple(None if value == "" else _cell(value) for value in row)
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook[sheet].iter_rows(values_only=True):
+            yield tuple(_cell(value) for value in row)
+    finally:
+        workbook.close()
+
+
+def _header(row: tuple) -> List[str]:
+    """表头: 空列名补为 column_<序号>, 重复列名加后缀"""
+    names = []
+    for i, value in enumerate(row):
+        name = str(value).strip() if value is not None else ""
+        name = name or f"column_{i + 1}"
+        base, suffix = name, 2
+        while name in names:
+            name = f"{base}_{suffix}"
+            suffix += 1
+        names.append(name)
+    return names
+
+
+def _column(values: list) -> pa.Array:
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed types within the chunk
+        return pa.array([None if v is None else str(v) for v in values], pa.string())
+
+
+def _promote(current: pa.DataType, new: pa.DataType) -> pa.DataType:
+    if current == new or pa.types.is_null(new):
+        return current
+    if pa.types.is_null(current):
+        return new
+    if pa.types.is_integer(current) and pa.types.is_floating(new):
+        return pa.float64()
+    if pa.types.is_floating(current) and pa.types.is_integer(new):
+        return pa.float64()
+    return pa.string()
+
+
+def _cast(table: pa.Table, schema: pa.Schema) -> Optional[pa.Table]:
+    try:
+        return table.cast(schema)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        return None
+
+
+def _string_cast(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """把需要提升为字符串的列逐值转换 (Arrow 不支持例如 timestamp → string 之外的一些转换)"""
+    columns = []
+    for column, field in zip(table.columns, schema):
+        if pa.types.is_string(field.type) and not pa.types.is_string(column.type):
+            values = [None if v is None else str(v) for v in column.to_pylist()]
+            columns.append(pa.array(values, pa.string()))
+        else:
+            columns.append(column.cast(field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def sheet_to_parquet(path: Path, sheet: str, parquet_path: Path, chunk_rows: int = CHUNK_ROWS):
+    """把一个工作表分块转换为 Parquet, 第一行为表头"""
+    rows = (row for row in iter_rows(path, sheet) if any(value is not None for value in row))
+    header = _header(next(rows, ()))
+    if not header:
+        raise ValueError(f"工作表 {sheet} 为空")
+
+    work_dir = Path(tempfile.mkdtemp(dir=parquet_path.parent, prefix=".sheet-"))
+    try:
+        parts: List[Path] = []
+        writer, schema = None, None
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk and writer is not None:
+                break
+            # Pad short rows and drop cells beyond the header
+            columns = [[] for _ in header]
+            for row in chunk:
+                for i in range(len(header)):
+                    columns[i].append(row[i] if i < len(row) else None)
+            table = pa.Table.from_arrays([_column(values) for values in columns], names=header)
+
+            cast = _cast(table, schema) if schema is not None else None
+            if cast is None:
+                if schema is not None:
+                    schema = pa.schema(
+                        [
+                            pa.field(name, _promote(current.type, new.type))
+                            for name, current, new in zip(header, schema, table.schema)
+                        ]
+                    )
+                else:
+                    schema = table.schema
+                cast = _cast(table, schema) or _string_cast(table, schema)
+                if writer is not None:
+                    writer.close()
+                parts.append(work_dir / f"part-{len(parts)}.parquet")
+                writer = pq.ParquetWriter(parts[-1], schema)
+            writer.write_table(cast)
+            if not chunk:
+                break
+        writer.close()
+
+        if len(parts) == 1:
+            parts[0].replace(parquet_path)
+        else:
+            files = ", ".join(sql_literal(part) for part in parts)
+            duckdb.connect().execute(
+                f"COPY (SELECT * FROM read_parquet([{files}], union_by_name = true)) "
+                f"TO {sql_literal(parquet_path)} (FORMAT PARQUET)"
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
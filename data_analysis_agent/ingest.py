@@ -0,0 +1,232 @@
+"""
+上传文件的持久化导入缓存
+
+每个上传文件按内容的 SHA-256 只导入一次: 原始文件被转换为 Parquet 存放在缓存目录中,
+之后的 Streamlit 重跑和新会话都直接复用。DuckDB 通过视图读取 Parquet, 不再重新解析原始文件。
+
+缓存目录默认是 ~/.cache/data_analysis_agent, 可通过环境变量 DATA_AGENT_CACHE_DIR 修改。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import duckdb
+import pandas as pd
+
+CACHE_DIR = Path(
+    os.environ.get("DATA_AGENT_CACHE_DIR", Path.home() / ".cache" / "data_analysis_agent")
+)
+
+
+def sql_literal(value) -> str:
+    """把字符串转成 SQL 字符串字面量"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def sql_identifier(name: str) -> str:
+    """把名称转成带双引号的 SQL 标识符"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def file_hash(uploaded_file) -> str:
+    """按内容计算上传文件的 SHA-256"""
+    digest = hashlib.sha256()
+    digest.update(uploaded_file.getbuffer())
+    return digest.hexdigest()
+
+
+def get_upload_hash(uploaded_file, hashes: Optional[dict] = None) -> str:
+    """
+    同一个上传文件只计算一次内容哈希
+
+    Args:
+        hashes: (file_id, size) → 哈希的缓存; 默认使用 Streamlit 会话中的 upload_hashes
+    """
+    if hashes is None:
+        import streamlit as st
+
+        hashes = st.session_state.setdefault("upload_hashes", {})
+    key = (uploaded_file.file_id, uploaded_file.size)
+    if key not in hashes:
+        hashes[key] = file_hash(uploaded_file)
+    return hashes[key]
+
+
+def is_excel(path: Path) -> bool:
+    return Path(path).suffix.lower() in (".xlsx", ".xls")
+
+
+def excel_sheets(source_path: Path) -> List[str]:
+    """Excel 文件的工作表名称"""
+    from excel import sheet_names
+
+    return sheet_names(source_path)
+
+
+def dataset_key(digest: str, sheet: Optional[str] = None) -> str:
+    """数据集在缓存目录中的键: 文件内容哈希, Excel 指定工作表时再加上工作表名的哈希"""
+    if sheet is None:
+        return digest
+    return f"{digest}-{hashlib.sha256(sheet.encode('utf-8')).hexdigest()[:12]}"
+
+
+def convert_to_parquet(source_path: Path, parquet_path: Path, sheet: Optional[str] = None):
+    """把 CSV、Excel (默认第一个工作表) 或 Parquet 文件转换为 Parquet"""
+    suffix = source_path.suffix.lower()
+    if suffix == ".csv":
+        duckdb.connect().execute(
+            f"COPY (SELECT * FROM read_csv_auto({sql_literal(source_path)})) "
+            f"TO {sql_literal(parquet_path)} (FORMAT PARQUET)"
+        )
+    elif suffix == ".parquet":
+        shutil.copyfile(source_path, parquet_path)
+    else:
+        from excel import CalamineWorkbook, sheet_to_parquet
+
+        if suffix == ".xls" and CalamineWorkbook is None:
+            # openpyxl cannot read the legacy format
+            pd.read_excel(source_path, sheet_name=sheet or 0).to_parquet(parquet_path, index=False)
+        else:
+            sheet_to_parquet(source_path, sheet or excel_sheets(source_path)[0], parquet_path)
+
+
+def load_meta(digest: str) -> Optional[dict]:
+    """已导入数据集的元数据, 未导入为 None"""
+    meta_path = CACHE_DIR / digest / "meta.json"
+    if meta_path.exists():
+        return json.loads(meta_path.read_text(encoding="utf-8"))
+    return None
+
+
+def stage_upload(uploaded_file, digest: str) -> Path:
+    """把上传文件原样保存到缓存目录的 uploads/ 下, 等待转换"""
+    staged_path = CACHE_DIR / "uploads" / (digest + Path(uploaded_file.name).suffix.lower())
+    if not staged_path.exists():
+        staged_path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = staged_path.with_name(f".{staged_path.name}.{os.getpid()}")
+        with open(partial_path, "wb") as f:
+            f.write(uploaded_file.getbuffer())
+        partial_path.replace(staged_path)
+    return staged_path
+
+
+def ingest_file(source_path: Path, name: str, digest: str, sheet: Optional[str] = None) -> dict:
+    """
+    把已保存的源文件导入为数据集, 已导入过的内容直接返回缓存的元数据
+
+    Args:
+        sheet: Excel 工作表; 指定时每个工作表是一个数据集, 表名为 <文件名>_<工作表名>
+
+    Returns:
+        dict: name, table, hash (数据集键), parquet (Parquet 路径), rows, columns ([列名, 类型]), sheet
+    """
+    digest = dataset_key(digest, sheet)
+    meta = load_meta(digest)
+    if meta is not None:
+        return meta
+
+    dataset_dir = CACHE_DIR / digest
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # Build in a scratch directory and rename, so readers never see a half-written dataset
+    work_dir = Path(tempfile.mkdtemp(dir=CACHE_DIR, prefix=f".{digest[:12]}-"))
+    try:
+        convert_to_parquet(source_path, work_dir / "data.parquet", sheet)
+
+        parquet_path = dataset_dir / "data.parquet"
+        relation = duckdb.connect().sql(
+            f"SELECT * FROM read_parquet({sql_literal(work_dir / 'data.parquet')})"
+        )
+        meta = {
+            "name": name,
+            "table": Path(name).stem if sheet is None else f"{Path(name).stem}_{sheet}",
+            "hash": digest,
+            "parquet": str(parquet_path),
+            "rows": relation.aggregate("count(*)").fetchone()[0],
+            "columns": [[name, str(dtype)] for name, dtype in zip(relation.columns, relation.dtypes)],
+            "sheet": sheet,
+        }
+        (work_dir / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+        try:
+            work_dir.rename(dataset_dir)
+        except OSError:
+            # Another session imported the same content first
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return load_meta(digest)
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+
+def ingest_upload(uploaded_file, digest: str, sheet: Optional[str] = None) -> dict:
+    """
+    导入上传文件, 已导入过的内容直接返回缓存的元数据
+
+    Returns:
+        dict: 同 ingest_file()
+    """
+    meta = load_meta(dataset_key(digest, sheet))
+    if meta is not None:
+        return meta
+    staged_path = stage_upload(uploaded_file, digest)
+    meta = ingest_file(staged_path, uploaded_file.name, digest, sheet)
+    # Other sheets of the workbook may still be imported later
+    if not is_excel(staged_path):
+        staged_path.unlink(missing_ok=True)
+    return meta
+
+
+def connect_dataset(meta: dict) -> duckdb.DuckDBPyConnection:
+    """创建一个内存 DuckDB 连接, 并把数据集注册为以表名命名的视图"""
+    connection = duckdb.connect()
+    connection.execute(
+        f"CREATE VIEW {sql_identifier(meta['table'])} AS "
+        f"SELECT * FROM read_parquet({sql_literal(meta['parquet'])})"
+    )
+    return connection
+
+
+def count_nulls(connection: duckdb.DuckDBPyConnection, table: str, columns: list) -> list:
+    """用一条聚合查询统计每列的缺失值数量"""
+    counts = connection.sql(
+        "SELECT count(*), "
+        + ", ".join(f"count({sql_identifier(name)})" for name in columns)
+        + f" FROM {sql_identifier(table)}"
+    ).fetchone()
+    return [counts[0] - non_null for non_null in counts[1:]]
+
+
+def preview_dataset(meta: dict, limit: int = 5) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    数据预览和列信息, 只取前几行, 不把整张表加载到 pandas
+
+    缺失值统计对每个数据集只计算一次, 保存在缓存目录的 preview.json 中
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: (前 limit 行, 列信息表)
+    """
+    connection = connect_dataset(meta)
+    head = connection.sql(f"SELECT * FROM {sql_identifier(meta['table'])} LIMIT {int(limit)}").df()
+
+    columns = [name for name, _ in meta["columns"]]
+    preview_path = Path(meta["parquet"]).with_name("preview.json")
+    if preview_path.exists():
+        null_counts = json.loads(preview_path.read_text(encoding="utf-8"))["null_counts"]
+    else:
+        null_counts = count_nulls(connection, meta["table"], columns)
+        preview_path.write_text(json.dumps({"null_counts": null_counts}), encoding="utf-8")
+
+    column_info = pd.DataFrame(
+        {
+            "列名": columns,
+            "数据类型": [dtype for _, dtype in meta["columns"]],
+            "非空值数量": [meta["rows"] - nulls for nulls in null_counts],
+            "缺失值数量": null_counts,
+        }
+    )
+    return head, column_info
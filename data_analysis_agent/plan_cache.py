@@ -0,0 +1,122 @@
+"""
+问题到 SQL 的持久化缓存
+
+按 (表结构指纹, 规范化问题) 保存智能体得出结论所用的 SQL, 不含查看表结构、样例行的探索性查询。
+重复的问题不再调用模型, 只需重新执行保存的 SQL。表结构相同的不同数据 (如按月拆分的文件) 也能复用同一组 SQL:
+指纹只包含列名和类型, 保存的 SQL 中的表名换成占位符, 执行前再换成当前数据集的表名;
+只有数据集哈希也相同时, 上次的文字分析才仍然成立。
+
+缓存保存在缓存目录的 plans.sqlite3 中。
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from ingest import CACHE_DIR, sql_identifier
+
+
+# Stands in for the table name in stored SQL, so a plan applies to any table with the same columns
+TABLE_PLACEHOLDER = "__plan_table__"
+
+
+def schema_fingerprint(meta: dict) -> str:
+    """列 (名称, 类型) 的哈希; 不含由文件名得到的表名"""
+    schema = json.dumps(meta["columns"], ensure_ascii=False)
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()
+
+
+def _replace_table(query: str, old: str, new: str) -> str:
+    """把查询中的表名 old (带双引号或不带) 换成 new, 字符串字面量中的内容不变"""
+    pattern = re.compile(
+        r"'(?:[^']|'')*'|" + re.escape(sql_identifier(old)) + r"|\b" + re.escape(old) + r"\b"
+    )
+    return pattern.sub(lambda m: m.group(0) if m.group(0).startswith("'") else new, query)
+
+
+def normalize_question(question: str) -> str:
+    """忽略大小写、空白和句末标点的差异"""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?？.。!！ ")
+
+
+class PlanCache:
+    """SQLite 中的问题 → SQL 缓存"""
+
+    def __init__(self, path: Path = CACHE_DIR / "plans.sqlite3"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS plans (
+                    schema TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    queries TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    dataset_hash TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (schema, question)
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call, so Streamlit threads never share one
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, meta: dict, question: str) -> Optional[dict]:
+        """
+        Returns:
+            Optional[dict]: queries (已换成 meta 表名的 SQL 列表), answer, dataset_hash, created;
+            未命中为 None
+        """
+        key = (schema_fingerprint(meta), normalize_question(question))
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT queries, answer, dataset_hash, created FROM plans "
+                "WHERE schema = ? AND question = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE plans SET hits = hits + 1 WHERE schema = ? AND question = ?", key
+            )
+        queries, answer, dataset_hash, created = row
+        table = sql_identifier(meta["table"])
+        return {
+            "queries": [
+                _replace_table(query, TABLE_PLACEHOLDER, table) for query in json.loads(queries)
+            ],
+            "answer": answer,
+            "dataset_hash": dataset_hash,
+            "created": created,
+        }
+
+    def put(self, meta: dict, question: str, queries: List[str], answer: str):
+        """保存一次分析; 没有执行任何查询的分析不缓存"""
+        if not queries:
+            return
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO plans "
+                "(schema, question, queries, answer, dataset_hash, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    schema_fingerprint(meta),
+                    normalize_question(question),
+                    json.dumps(
+                        [_replace_table(q, meta["table"], TABLE_PLACEHOLDER) for q in queries],
+                        ensure_ascii=False,
+                    ),
+                    answer,
+                    meta["hash"],
+                    time.time(),
+                ),
+            )
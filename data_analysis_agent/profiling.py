@@ -0,0 +1,147 @@
+"""
+数据集列统计
+
+对每个数据集只计算一次紧凑的列统计 (基数、最小/最大值、缺失比例、高频值、示例值),
+用一条 DuckDB 聚合查询同时算出所有列, 结果保存在数据集缓存目录的 profile.json 中。
+format_profile() 按字符预算把统计写进智能体提示, 减少模型为了了解数据而发起的探索性查询。
+"""
+
+import json
+from pathlib import Path
+from typing import List
+
+import duckdb
+
+from ingest import connect_dataset, sql_identifier
+
+TOP_K = 5
+# Top values are listed only for columns with fewer distinct values than this share of non-null rows
+TOP_VALUES_MAX_DISTINCT_RATIO = 0.5
+SAMPLE_ROWS = 5
+MAX_VALUE_CHARS = 30
+
+
+def _short(value) -> str:
+    text = str(value)
+    return text if len(text) <= MAX_VALUE_CHARS else text[: MAX_VALUE_CHARS - 1] + "…"
+
+
+def _top_values(connection, table: str, columns: List[str]) -> List[list]:
+    """每列的高频值; 优先用 approx_top_k 一次算出, 旧版 DuckDB 退回逐列 GROUP BY"""
+    try:
+        row = connection.sql(
+            "SELECT "
+            + ", ".join(
+                f"approx_top_k({sql_identifier(name)}, {TOP_K})::VARCHAR[]" for name in columns
+            )
+            + f" FROM {sql_identifier(table)}"
+        ).fetchone()
+        return [[value for value in values if value is not None] for values in row]
+    except duckdb.Error:
+        top_values = []
+        for name in columns:
+            column = sql_identifier(name)
+            rows = connection.sql(
+                f"SELECT {column}::VARCHAR FROM {sql_identifier(table)} WHERE {column} IS NOT NULL "
+                f"GROUP BY {column} ORDER BY count(*) DESC LIMIT {TOP_K}"
+            ).fetchall()
+            top_values.append([value for (value,) in rows])
+        return top_values
+
+
+def compute_profile(meta: dict) -> List[dict]:
+    """用向量化的 DuckDB 聚合计算所有列的统计"""
+    connection = connect_dataset(meta)
+    table = meta["table"]
+    columns = [name for name, _ in meta["columns"]]
+
+    aggregates = []
+    for name in columns:
+        column = sql_identifier(name)
+        aggregates += [
+            f"approx_count_distinct({column})",
+            f"count({column})",
+            f"min({column})::VARCHAR",
+            f"max({column})::VARCHAR",
+        ]
+    stats = connection.sql(f"SELECT {', '.join(aggregates)} FROM {sql_identifier(table)}").fetchone()
+    top_values = _top_values(connection, table, columns)
+    sample = connection.sql(
+        f"SELECT * FROM {sql_identifier(table)} USING SAMPLE reservoir({SAMPLE_ROWS} ROWS) REPEATABLE (42)"
+    ).fetchall()
+
+    rows = meta["rows"]
+    profile = []
+    for i, (name, dtype) in enumerate(meta["columns"]):
+        distinct, non_null, min_value, max_value = stats[i * 4 : i * 4 + 4]
+        samples = []
+        for record in sample:
+            value = record[i]
+            if value is not None and str(value) not in samples:
+                samples.append(str(value))
+        profile.append(
+            {
+                "name": name,
+                "type": dtype,
+                # approx_count_distinct can overshoot the number of values it counted
+                "distinct": min(distinct, non_null),
+                "non_null": non_null,
+                "null_ratio": round(1 - non_null / rows, 4) if rows else 0.0,
+                "min": min_value,
+                "max": max_value,
+                "top": top_values[i],
+                "samples": samples,
+            }
+        )
+    return profile
+
+
+def load_profile(meta: dict) -> List[dict]:
+    """读取数据集的列统计, 第一次使用时计算并保存到 profile.json"""
+    profile_path = Path(meta["parquet"]).with_name("profile.json")
+    if profile_path.exists():
+        profile = json.loads(profile_path.read_text(encoding="utf-8"))
+        # Profiles written before non_null was recorded have uncapped distinct counts
+        if all("non_null" in column for column in profile):
+            return profile
+    profile = compute_profile(meta)
+    profile_path.write_text(json.dumps(profile, ensure_ascii=False), encoding="utf-8")
+    return profile
+
+
+def _format_column(column: dict, detail: int) -> str:
+    """detail: 2 = 全部统计, 1 = 去掉示例值, 0 = 只有类型、基数和缺失比例"""
+    parts = [f"不同值≈{column['distinct']}", f"缺失 {column['null_ratio']:.1%}"]
+    if detail >= 1 and column["min"] is not None:
+        parts.append(f"范围 [{_short(column['min'])}, {_short(column['max'])}]")
+    # Top values only say something when the column is not (close to) unique
+    repeated = column["distinct"] < TOP_VALUES_MAX_DISTINCT_RATIO * column["non_null"]
+    if detail >= 1 and column["top"] and repeated:
+        parts.append("常见: " + ", ".join(_short(value) for value in column["top"]))
+    if detail >= 2 and column["samples"]:
+        parts.append("示例: " + ", ".join(_short(value) for value in column["samples"][:3]))
+    return f"- {column['name']} ({column['type']}): " + "; ".join(parts)
+
+
+def format_profile(profile: List[dict], budget: int = 3000) -> str:
+    """
+    把列统计序列化为提示文本, 总长度不超过 budget 个字符
+
+    超出预算时依次去掉示例值、范围和高频值, 最后只保留能放下的列
+    """
+    for detail in (2, 1, 0):
+        text = "\n".join(_format_column(column, detail) for column in profile)
+        if len(text) <= budget:
+            return text
+
+    lines = []
+    used = 0
+    for i, column in enumerate(profile):
+        line = _format_column(column, 0)
+        remaining = f"\n... 另有 {len(profile) - i} 列未列出"
+        if used + len(line) + 1 + len(remaining) > budget:
+            lines.append(remaining.strip())
+            break
+        lines.append(line)
+        used += len(line) + 1
+    return "\n".join(lines)
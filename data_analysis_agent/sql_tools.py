@@ -0,0 +1,328 @@
+"""
+带结果缓存的 DuckDB 工具
+
+CachedDuckDbTools 替换 DuckDbTools.run_query: 查询文本先规范化 (去注释、合并空白、
+关键字小写、IN 列表中的常量排序), 再和数据集内容哈希、预览行数一起作为缓存键。
+数据集按内容哈希导入后不会变化, 所以同一数据集上的同一查询可以直接返回缓存结果。
+
+QueryResultCache 是按结果字节数限制大小的 LRU 缓存, 可以在多个会话之间共享。
+
+查询结果按 Arrow record batch 分批读取: 模型只收到前 preview_rows 行和总行数,
+超出的完整结果写入缓存目录 results/<数据集哈希>/ 下的 Parquet 文件, 供下载或后续查询使用。
+这些文件的总大小不超过 RESULTS_MAX_BYTES (按最近使用时间淘汰), 结果缓存淘汰某条查询时也删除它的文件。
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from agno.tools.duckdb import DuckDbTools
+
+from ingest import CACHE_DIR
+
+RESULTS_DIR = CACHE_DIR / "results"
+# Spilled results beyond this total are deleted, least recently used first
+RESULTS_MAX_BYTES = 1024 * 1024 * 1024
+BATCH_ROWS = 10_000
+
+# String literals, quoted identifiers, dollar-quoted strings, comments, whitespace, everything else
+_TOKEN = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\$(\w*)\$.*?\$\1\$|--[^\n]*|/\*.*?\*/|\s+"
+    r"|[^'\"\s$-]+|[-$]",
+    re.DOTALL,
+)
+# Quoted tokens are replaced by \x00<index>\x00 while the rest of the query is normalized
+_PLACEHOLDER = re.compile(r"\x00(\d+)\x00")
+_IN_LIST = re.compile(r"\bin \(([^()]*)\)")
+# The clause an IN list belongs to; only lists in filters can be reordered (not e.g. PIVOT ... IN)
+_CLAUSE = re.compile(
+    r"\b(where|having|qualify|select|from|on|for|pivot|unpivot|using|group by|order by)\b"
+)
+_FILTER_CLAUSES = ("where", "having", "qualify")
+# Schema lookups and row samples the agent runs while exploring, not to compute the answer
+_EXPLORATORY = re.compile(
+    r"^(describe|summarize|show|pragma)\b"
+    r"|\b(information_schema|duckdb_columns|duckdb_tables|duckdb_views|pragma_table_info)\b"
+    r"|^select \* from [^ ]+( limit \d+)?$"
+)
+_LITERAL = re.compile(r"-?\d+(?:\.\d+)?|'(?:[^']|'')*'")
+_READ_ONLY = ("select", "with", "from", "summarize", "describe", "pivot", "unpivot", "values")
+_VOLATILE = re.compile(
+    r"\b(random|uuid|gen_random_uuid|now|today|current_date|current_time|current_timestamp)\b"
+)
+
+
+def _sorted_in_list(match: re.Match, literals: List[str]) -> str:
+    """
+    只对过滤条件 (WHERE/HAVING/QUALIFY) 中全部是常量的 IN 列表排序, 这时顺序不影响结果;
+    PIVOT ... IN 等列表的顺序决定输出列的顺序, 保持不变
+    """
+    clauses = _CLAUSE.findall(match.string, 0, match.start())
+    if not clauses or clauses[-1] not in _FILTER_CLAUSES:
+        return match.group(0)
+    resolved = _PLACEHOLDER.sub(lambda m: literals[int(m.group(1))], match.group(1))
+    items = [item.strip() for item in _split_literals(resolved)]
+    if not items or not all(_LITERAL.fullmatch(item) for item in items):
+        return match.group(0)
+    return "in (" + ", ".join(sorted(items)) + ")"
+
+
+def _split_literals(text: str):
+    """按逗号拆分, 忽略字符串字面量中的逗号"""
+    parts, current = [], ""
+    for token in re.findall(r"'(?:[^']|'')*'|[^,']+|,", text):
+        if token == ",":
+            parts.append(current)
+            current = ""
+        else:
+            current += token
+    parts.append(current)
+    return parts
+
+
+def normalize_sql(query: str) -> str:
+    """
+    规范化 SQL 文本, 使只有格式差异的查询得到相同的缓存键
+
+    与 DuckDbTools.run_query 一样去掉反引号并只保留第一条语句;
+    字符串字面量 (包括 $$...$$) 和带引号的标识符保持原样
+    """
+    parts, literals = [], []
+    for match in _TOKEN.finditer(query.replace("`", "")):
+        token = match.group(0)
+        if token.startswith(("'", '"')) or (token.startswith("$") and len(token) > 1):
+            parts.append(f"\x00{len(literals)}\x00")
+            literals.append(token)
+        elif token.startswith("--") or token.startswith("/*") or token.isspace():
+            parts.append(" ")
+        elif token == ";":
+            break
+        elif ";" in token:
+            parts.append(token.split(";")[0].lower())
+            break
+        else:
+            parts.append(token.lower())
+    normalized = re.sub(r" +", " ", "".join(parts)).strip()
+    normalized = re.sub(r" ?([(),]) ?", r"\1 ", normalized).replace("( ", "(").replace(" )", ")")
+    normalized = re.sub(r" +", " ", normalized).strip()
+    normalized = re.sub(r"\bin\(", "in (", normalized)
+    normalized = _IN_LIST.sub(lambda m: _sorted_in_list(m, literals), normalized)
+    return _PLACEHOLDER.sub(lambda m: literals[int(m.group(1))], normalized)
+
+
+def is_read_only(normalized: str) -> bool:
+    """规范化后的查询是否只读"""
+    return normalized.startswith(_READ_ONLY)
+
+
+def is_exploratory(normalized: str) -> bool:
+    """规范化后的查询是否只是查看表结构或样例行"""
+    return bool(_EXPLORATORY.search(normalized))
+
+
+def is_cacheable(normalized: str) -> bool:
+    """只缓存只读且结果确定的查询"""
+    return is_read_only(normalized) and not _VOLATILE.search(normalized)
+
+
+def format_rows(columns: List[str], rows: List[tuple]) -> str:
+    """与 DuckDbTools.run_query 相同的结果格式: 首行为列名, 之后每行逗号分隔"""
+    lines = [str(row[0]) if len(row) == 1 else ",".join(str(x) for x in row) for row in rows]
+    return ",".join(columns) + "\n" + "\n".join(lines)
+
+
+def spill_path(dataset_hash: str, normalized: str, preview_rows: int) -> Path:
+    """超出 preview_rows 的完整结果的 Parquet 路径"""
+    key = f"{dataset_hash}\n{normalized}\n{preview_rows}"
+    name = hashlib.sha256(key.encode("utf-8")).hexdigest() + ".parquet"
+    return RESULTS_DIR / dataset_hash / name
+
+
+def prune_results(max_bytes: int = RESULTS_MAX_BYTES):
+    """删除最久未使用的结果文件, 直到总大小不超过 max_bytes"""
+    files = []
+    for path in RESULTS_DIR.glob("*/*.parquet"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files, key=lambda item: item[0]):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+class QueryResultCache:
+    """按结果字节数限制大小的 LRU 查询结果缓存, 线程安全; 淘汰的条目同时删除其结果文件"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[Tuple[str, str, int], str]" = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: Tuple[str, str, int]) -> Optional[str]:
+        with self.lock:
+            result = self.entries.get(key)
+            if result is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return result
+
+    def put(self, key: Tuple[str, str, int], result: str):
+        size = len(result.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        evicted_keys = []
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key).encode("utf-8"))
+            self.entries[key] = result
+            self.size += size
+            while self.size > self.max_bytes:
+                evicted_key, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.encode("utf-8"))
+                self.stats["evictions"] += 1
+                evicted_keys.append(evicted_key)
+        for evicted_key in evicted_keys:
+            spill_path(*evicted_key).unlink(missing_ok=True)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+
+class CachedDuckDbTools(DuckDbTools):
+    """run_query 结果按 (数据集哈希, 规范化 SQL, 预览行数) 缓存, 并且只把有限的行数返回给模型的 DuckDbTools"""
+
+    def __init__(
+        self,
+        cache: QueryResultCache,
+        dataset_hash: str,
+        prepare: Optional[Callable[[str], None]] = None,
+        on_batch: Optional[Callable[[int, str, pa.RecordBatch], None]] = None,
+        preview_rows: int = 50,
+        **kwargs,
+    ):
+        self.cache = cache
+        self.dataset_hash = dataset_hash
+        # Called with the query before it runs, e.g. to convert lazily registered tables
+        self.prepare = prepare
+        # Called with (query index, query, batch) for every fetched batch, e.g. to stream into the UI
+        self.on_batch = on_batch
+        self.preview_rows = preview_rows
+        # Successful queries in execution order, recorded for the plan cache
+        self.executed_queries: List[str] = []
+        # (query, Parquet path, rows) of results too large to return in full
+        self.spilled: List[Tuple[str, Path, int]] = []
+        super().__init__(**kwargs)
+
+    def _fetch(self, formatted_sql: str, relation, path: Path) -> Tuple[str, int]:
+        """
+        分批读取结果: 前 preview_rows 行返回给模型, 超出时把完整结果写入 path
+
+        Returns:
+            Tuple[str, int]: (返回给模型的文本, 总行数)
+        """
+        index = len(self.executed_queries)
+        preview: List[tuple] = []
+        pending: List[pa.RecordBatch] = []
+        writer, total = None, 0
+        partial_path = path.with_name(
+            f".{path.name}.{os.getpid()}-{threading.get_ident()}"
+        )
+        try:
+            for batch in relation.fetch_record_batch(BATCH_ROWS):
+                if self.on_batch is not None:
+                    self.on_batch(index, formatted_sql, batch)
+                if len(preview) < self.preview_rows:
+                    head = batch.slice(0, self.preview_rows - len(preview))
+                    preview += list(zip(*(column.to_pylist() for column in head.columns)))
+                total += batch.num_rows
+
+                # Only results larger than the preview are written to disk
+                pending.append(batch)
+                if writer is None and total > self.preview_rows:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    writer = pq.ParquetWriter(partial_path, batch.schema)
+                if writer is not None:
+                    for pending_batch in pending:
+                        writer.write_batch(pending_batch)
+                    pending = []
+            if writer is not None:
+                writer.close()
+                partial_path.replace(path)
+                prune_results()
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            partial_path.unlink(missing_ok=True)
+            raise
+
+        text = format_rows(relation.columns, preview)
+        if total > self.preview_rows:
+            text += (
+                f"\n... 共 {total} 行, 只返回了前 {self.preview_rows} 行。"
+                f"完整结果已保存, 需要时可以查询 read_parquet('{path}'), "
+                "请尽量用聚合或 LIMIT 缩小结果"
+            )
+        return text, total
+
+    def run_query(self, query: str) -> str:
+        """Function that runs a query and returns the result.
+
+        Args:
+            query (str): SQL query to run
+
+        Returns:
+            str: Result of the query
+        """
+        # Same preprocessing as DuckDbTools.run_query
+        formatted_sql = query.replace("`", "").split(";")[0]
+        normalized = normalize_sql(query)
+        # The returned text depends on preview_rows, like the spill path
+        key = (self.dataset_hash, normalized, self.preview_rows)
+        cacheable = is_cacheable(normalized)
+        path = spill_path(*key)
+        if cacheable:
+            result = self.cache.get(key)
+            # A cached result whose spill file was pruned is run again to restore the file
+            if result is not None and (path.exists() or str(path) not in result):
+                self.executed_queries.append(formatted_sql)
+                if path.exists():
+                    # Mark the file as recently used for prune_results
+                    os.utime(path)
+                    rows = pq.ParquetFile(path).metadata.num_rows
+                    self.spilled.append((formatted_sql, path, rows))
+                return result
+
+        try:
+            if self.prepare is not None:
+                self.prepare(formatted_sql)
+            relation = self.connection.sql(formatted_sql)
+            if relation is None:
+                result, total = "No output", 0
+            else:
+                result, total = self._fetch(formatted_sql, relation, path)
+        except Exception as e:
+            # Like DuckDbTools.run_query, any failure goes back to the model as text
+            return str(e)
+        self.executed_queries.append(formatted_sql)
+        if total > self.preview_rows:
+            self.spilled.append((formatted_sql, path, total))
+        if cacheable:
+            self.cache.put(key, result)
+        return result
@@ -0,0 +1,241 @@
+"""
+多文件工作区
+
+一个 DuckDB 连接中注册多个上传文件, 每个文件一个视图, 智能体可以跨文件查询。
+上传时只把原始文件保存到缓存目录; CSV 和 Parquet 先注册为直接读取原始文件的视图,
+查询第一次引用某张表时才转换为 Parquet 并把视图切换过去。Excel 文件的每个工作表各是一张表,
+上传时即转换。
+
+join_candidates() 根据列名和类型推断可能的连接键, same_schema_groups() 找出结构相同、
+可以 UNION ALL 的表 (例如按月拆分的文件), 两者都写入智能体提示。
+"""
+
+import hashlib
+import re
+import threading
+from itertools import permutations
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import duckdb
+
+from ingest import (
+    dataset_key,
+    excel_sheets,
+    ingest_file,
+    is_excel,
+    load_meta,
+    sql_identifier,
+    sql_literal,
+    stage_upload,
+)
+
+# Formats DuckDB can query in place before conversion; others are converted on upload
+RAW_READERS = {".csv": "read_csv_auto", ".parquet": "read_parquet"}
+KEY_NAMES = ("id", "key", "code", "编号", "代码")
+KEY_SUFFIXES = ("_id", "_key", "_code", "_no", "编号", "代码")
+
+
+def _normalize_column(name: str) -> str:
+    return re.sub(r"[^0-9a-z一-鿿]+", "_", name.lower()).strip("_")
+
+
+def _type_family(dtype: str) -> str:
+    dtype = dtype.upper()
+    if any(t in dtype for t in ("INT", "DECIMAL", "DOUBLE", "FLOAT", "REAL", "NUMERIC")):
+        return "number"
+    if any(t in dtype for t in ("DATE", "TIME")):
+        return "time"
+    return "text"
+
+
+def _is_key_like(column: str) -> bool:
+    return column in KEY_NAMES or column.endswith(KEY_SUFFIXES)
+
+
+class Workspace:
+    """多个数据文件组成的工作区, 每个文件注册为一个 DuckDB 视图"""
+
+    def __init__(self):
+        self.connection = duckdb.connect()
+        # table -> {"name", "hash", "sheet", "source" (未转换的原始文件), "meta" (转换后的元数据)}
+        self.tables: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def add_upload(self, uploaded_file, digest: str) -> List[str]:
+        """加入一个上传文件, 返回它在工作区中的表名; Excel 文件的每个工作表各是一张表"""
+        stem = Path(uploaded_file.name).stem
+        if not is_excel(uploaded_file.name):
+            return [self._add_table(stem, uploaded_file, digest, None)]
+
+        source = stage_upload(uploaded_file, digest)
+        sheets = excel_sheets(source)
+        tables = []
+        for sheet in sheets:
+            table = stem if len(sheets) == 1 else f"{stem}_{sheet}"
+            tables.append(self._add_table(table, uploaded_file, digest, sheet))
+        source.unlink(missing_ok=True)
+        return tables
+
+    def _add_table(self, table: str, uploaded_file, digest: str, sheet: Optional[str]) -> str:
+        base, suffix = table, 2
+        while table in self.tables:
+            table = f"{base}_{suffix}"
+            suffix += 1
+
+        entry = {
+            "name": uploaded_file.name,
+            "hash": digest,
+            "sheet": sheet,
+            "source": None,
+            "meta": load_meta(dataset_key(digest, sheet)),
+        }
+        if entry["meta"] is None:
+            entry["source"] = stage_upload(uploaded_file, digest)
+        self.tables[table] = entry
+        # DuckDB cannot read Excel in place, so sheets are converted right away
+        if entry["meta"] is None and entry["source"].suffix not in RAW_READERS:
+            self.ensure_converted(table)
+        else:
+            self._register(table)
+        return table
+
+    def _register(self, table: str):
+        entry = self.tables[table]
+        if entry["meta"] is not None:
+            source = f"read_parquet({sql_literal(entry['meta']['parquet'])})"
+        else:
+            reader = RAW_READERS[entry["source"].suffix]
+            source = f"{reader}({sql_literal(entry['source'])})"
+        self.connection.execute(
+            f"CREATE OR REPLACE VIEW {sql_identifier(table)} AS SELECT * FROM {source}"
+        )
+
+    def ensure_converted(self, table: str) -> dict:
+        """把表转换为 Parquet (已转换则直接返回), 并把视图切换到 Parquet"""
+        with self.lock:
+            entry = self.tables[table]
+            if entry["meta"] is None:
+                entry["meta"] = ingest_file(
+                    entry["source"], entry["name"], entry["hash"], entry["sheet"]
+                )
+                # Excel sources are removed once all sheets are in
+                if not is_excel(entry["source"]):
+                    entry["source"].unlink(missing_ok=True)
+                entry["source"] = None
+                self._register(table)
+            return entry["meta"]
+
+    def referenced_tables(self, query: str) -> List[str]:
+        """查询中出现的工作区表名"""
+        text = query.lower()
+        return [
+            table
+            for table in self.tables
+            if re.search(r"(?<![\w])" + re.escape(table.lower()) + r"(?![\w])", text)
+        ]
+
+    def prepare(self, query: str):
+        """执行查询前调用: 转换查询引用到的所有表"""
+        for table in self.referenced_tables(query):
+            self.ensure_converted(table)
+
+    def columns(self, table: str) -> List[Tuple[str, str]]:
+        """表的 (列名, 类型); 未转换的表由 DuckDB 对原始文件采样推断"""
+        entry = self.tables[table]
+        if entry["meta"] is not None:
+            return [tuple(column) for column in entry["meta"]["columns"]]
+        if "columns" not in entry:
+            entry["columns"] = [
+                (row[0], row[1])
+                for row in self.connection.sql(f"DESCRIBE {sql_identifier(table)}").fetchall()
+            ]
+        return entry["columns"]
+
+    def rows(self, table: str) -> Optional[int]:
+        """已转换的表的行数, 未转换为 None"""
+        meta = self.tables[table]["meta"]
+        return meta["rows"] if meta is not None else None
+
+    @property
+    def fingerprint(self) -> str:
+        """表名和文件内容哈希的组合, 作为查询结果缓存的数据集键"""
+        parts = sorted(
+            f"{table}:{dataset_key(entry['hash'], entry['sheet'])}"
+            for table, entry in self.tables.items()
+        )
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def same_schema_groups(self) -> List[List[str]]:
+        """列名和类型完全相同的表分组 (只返回两张及以上的组)"""
+        groups: Dict[tuple, List[str]] = {}
+        for table in self.tables:
+            groups.setdefault(tuple(self.columns(table)), []).append(table)
+        return [tables for tables in groups.values() if len(tables) > 1]
+
+    def join_candidates(self) -> List[dict]:
+        """
+        推断可能的连接键
+
+        - 两张表中规范化后同名的键列 (id、*_id、*_code 等), 且类型兼容
+        - 一张表的 <表名>_id 列对应另一张表的 id 列
+
+        结构完全相同的表之间不推断连接键, 它们应当 UNION ALL
+        """
+        candidates = []
+        order = {table: i for i, table in enumerate(self.tables)}
+        # Both directions for the <table>_id rule; same-name keys only once per pair
+        for left, right in permutations(self.tables, 2):
+            if self.columns(left) == self.columns(right):
+                continue
+            right_columns = {
+                _normalize_column(name): (name, dtype) for name, dtype in self.columns(right)
+            }
+            for left_name, left_type in self.columns(left):
+                normalized = _normalize_column(left_name)
+                matches = []
+                if (
+                    order[left] < order[right]
+                    and normalized in right_columns
+                    and _is_key_like(normalized)
+                ):
+                    matches.append((right_columns[normalized], "同名键列"))
+                if normalized == f"{_normalize_column(right)}_id" and "id" in right_columns:
+                    matches.append((right_columns["id"], f"{left_name} → {right}.id"))
+                for (right_name, right_type), reason in matches:
+                    if _type_family(left_type) != _type_family(right_type):
+                        reason += ", 类型不同, 连接时需要转换"
+                    candidates.append(
+                        {
+                            "left": left,
+                            "left_column": left_name,
+                            "right": right,
+                            "right_column": right_name,
+                            "reason": reason,
+                        }
+                    )
+        return candidates
+
+    def describe(self) -> str:
+        """写入智能体提示的工作区说明: 表、列、可合并的表和候选连接键"""
+        lines = ["工作区中的表:"]
+        for table, entry in self.tables.items():
+            rows = self.rows(table)
+            columns = ", ".join(f"{name} ({dtype})" for name, dtype in self.columns(table))
+            size = f"{rows} 行" if rows is not None else "行数未知"
+            source = entry["name"] if entry["sheet"] is None else f"{entry['name']} 工作表 {entry['sheet']}"
+            lines.append(f'- "{table}" (文件 {source}, {size}): {columns}')
+
+        groups = self.same_schema_groups()
+        if groups:
+            lines.append("\n结构相同、可以 UNION ALL 合并分析的表:")
+            lines += ["- " + ", ".join(f'"{table}"' for table in group) for group in groups]
+
+        candidates = self.join_candidates()
+        if candidates:
+            lines.append("\n候选连接键:")
+            for c in candidates:
+                left = f'"{c["left"]}"."{c["left_column"]}"'
+                right = f'"{c["right"]}"."{c["right_column"]}"'
+                lines.append(f"- {left} = {right} ({c['reason']})")
+        return "\n".join(lines)